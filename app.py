@@ -1,38 +1,147 @@
 # app.py  -- Single-file Adaptive Assessment (backend + frontend + DB seed + analytics)
+import ast
+import atexit
+import cProfile
+import csv
+import glob
+import gzip
+import hashlib
+import json
+import io
+import math
 import os
+import pstats
+import queue
 import random
+import secrets
+import shutil
+import sqlite3
+import threading
 import time
-from flask import Flask, request, jsonify, render_template_string
+import weakref
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import click
+try:
+    import numpy as np
+except ImportError:  # only the IRT engine and offline jobs need it
+    np = None
+try:
+    import brotli
+except ImportError:  # gzip variants are always built; br only when available
+    brotli = None
+from flask import Blueprint, Flask, current_app, g, has_app_context, has_request_context, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.sql import func
-from sqlalchemy import inspect, text
+from sqlalchemy import create_engine, event, insert, select, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.local import LocalProxy
 
-DB_FILE = "data.db"
+DB_FILE = os.environ.get("ASSESSMENT_DB", "data.db")   # relative paths live in instance/
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{DB_FILE}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+class DefaultConfig:
+    """Settings create_app() starts from; override any of them with its config argument."""
+    SQLALCHEMY_DATABASE_URI = f"sqlite:///{DB_FILE}"
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SESSION_STATE_CAPACITY = 50000   # adaptive states kept in memory (LRU)
+    MULTI_PROCESS = False             # several workers share the DB (set by wsgi.py)
+    CACHE_SYNC_INTERVAL = 1.0         # s between checks for question changes made by other processes
+    ADAPTIVE_ENGINE = 'heuristic'     # 'heuristic' (+/-1 on last-7 accuracy) | 'irt'
+    IRT_TOP_K = 5                     # pick randomly among the K most informative items
+    IRT_TARGET_SE = 0.3               # ability precision reported as reached
+    ASSET_MAX_AGE = 31536000          # s, fingerprinted /assets/* URLs
+    TEST_PACK_DEPTH = 6               # answers per offline test pack (tree of 2**depth - 1 nodes)
+    TEST_PACK_MAX_DEPTH = 10
+    BULK_ROSTER_MAX = 5000            # students per /sessions/bulk call
+    ANALYTICS_PAGE_SIZE = 200
+    ANALYTICS_MAX_PAGE_SIZE = 1000
+    # Write-behind for graded responses (see ResponseWriter)
+    WRITE_BEHIND = False
+    WRITE_BEHIND_BATCH = 256          # rows per transaction
+    WRITE_BEHIND_INTERVAL = 0.02      # s, max wait for a batch to fill
+    WRITE_BEHIND_DURABILITY = 'group' # 'group' | 'async'
+    WRITE_BEHIND_RETRIES = 3          # extra tries of a batch that hit a lock timeout (busy_timeout each)
+    WRITE_BEHIND_TIMEOUT = 30.0       # s a group-mode submit() or a flush() waits before raising
+    ARCHIVE_DIR = 'archive'           # response segments (see ResponseArchive), relative to instance/
+    SSE_INTERVAL = 0.5          # s, dashboard deltas are coalesced over this window
+    SSE_KEEPALIVE = 15.0        # s between comment lines on an idle stream
+    # Instrumentation (see Metrics); everything below is inert while METRICS_ENABLED is False
+    METRICS_ENABLED = False
+    PROFILE_SAMPLE_RATE = 0.0   # fraction of requests run under cProfile
+    PROFILE_SLOW_SECONDS = 0.5  # sampled profiles slower than this are logged
+    # Storage profile, applied to every new SQLite connection (set to {} for SQLite defaults).
+    # WAL lets readers run while submit_answer commits; NORMAL sync is durable across
+    # application crashes and only fsyncs on checkpoint.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,        # KiB, i.e. 64 MB page cache per connection
+        'mmap_size': 268435456,      # 256 MB memory-mapped reads
+        'busy_timeout': 5000,        # ms to wait for the write lock instead of failing
+        'temp_store': 'MEMORY',
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'connect_args': {'check_same_thread': False, 'timeout': 5},
+    }
+    # Added to SQLALCHEMY_ENGINE_OPTIONS by create_app() for file-backed databases only:
+    # in-memory SQLite gets a StaticPool, which takes none of them.
+    SQLALCHEMY_POOL_OPTIONS = {
+        'pool_size': 16,             # one connection per serving thread
+        'max_overflow': 16,
+        'pool_timeout': 10,
+    }
+
+db = SQLAlchemy()
+bp = Blueprint('assessment', __name__, cli_group=None)   # routes and CLI, registered by create_app
+_apps = weakref.WeakSet()   # apps created in this process, for _reset_after_fork
+
+def _per_app(name):
+    """Module-level handle on the current app's own instance of a cache or worker (see create_app)."""
+    return LocalProxy(lambda: current_app.extensions['assessment'][name])
+
+@event.listens_for(Engine, 'connect')
+def _apply_sqlite_pragmas(dbapi_conn, connection_record):
+    if not isinstance(dbapi_conn, sqlite3.Connection):
+        return
+    pragmas = current_app.config.get('SQLITE_PRAGMAS') if has_app_context() else DefaultConfig.SQLITE_PRAGMAS
+    cur = dbapi_conn.cursor()
+    for name, value in (pragmas or {}).items():
+        cur.execute(f"PRAGMA {name} = {value}")
+    cur.close()
 
 # ---------------- Models ----------------
 class Question(db.Model):
     __tablename__ = "question"
+    __table_args__ = (db.Index('ix_question_bank', 'difficulty', 'subject', 'id'),)   # covers the bank index load
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String, nullable=False)
-    options = db.Column(db.String, nullable=False)   # stringified list
+    options = db.Column(db.JSON, nullable=False)   # list of option strings
     answer = db.Column(db.String, nullable=False)
     difficulty = db.Column(db.Integer, nullable=False)  # 1..5
     subject = db.Column(db.String, nullable=False)  # 'Maths','Physics','Chemistry','General'
+    external_id = db.Column(db.String, unique=True, index=True)  # item id from an imported bank
+    irt_a = db.Column(db.Float)   # 2PL discrimination, NULL = 1.0
+    irt_b = db.Column(db.Float)   # 2PL difficulty on the ability scale, NULL = difficulty - 3
 
 class Session(db.Model):
     __tablename__ = "session"
+    __table_args__ = (db.Index('ix_session_student', 'student'), db.Index('ix_session_roll_no', 'roll_no'),
+                      db.Index('ix_session_created_at', 'created_at'))
     id = db.Column(db.Integer, primary_key=True)
     student = db.Column(db.String, nullable=False)
     roll_no = db.Column(db.String, nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    token = db.Column(db.String, unique=True, index=True)   # set for sessions pre-created by /sessions/bulk
+    first_question_id = db.Column(db.Integer)
 
 class Response(db.Model):
     __tablename__ = "response"
+    # covers the per-session history replay (session state rebuild) in id order
+    __table_args__ = (db.Index('ix_response_session', 'session_id', 'id', 'question_id', 'correct', 'difficulty', 'time_taken'),)
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('session.id'))
     question_id = db.Column(db.Integer)
@@ -41,230 +150,2088 @@ class Response(db.Model):
     time_taken = db.Column(db.Float)  # seconds
     subject = db.Column(db.String)
 
-# ---------------- Compatibility Check ----------------
-def ensure_db_schema():
+# Aggregates maintained by submit_answer in the same transaction as the Response insert
+class SessionStats(db.Model):
+    __tablename__ = "session_stats"
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    total_time = db.Column(db.Float, nullable=False, default=0.0)
+    total_difficulty = db.Column(db.Integer, nullable=False, default=0)
+
+class SubjectStats(db.Model):
+    __tablename__ = "session_subject_stats"
+    __table_args__ = (db.UniqueConstraint('session_id', 'subject'),)
+    id = db.Column(db.Integer, primary_key=True)   # insertion order = first time the subject was seen
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'), nullable=False)
+    subject = db.Column(db.String, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+
+# Offline jobs (flask calibrate)
+class ItemCalibration(db.Model):
+    __tablename__ = "item_calibration"
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True)
+    responses = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    total_time = db.Column(db.Float, nullable=False, default=0.0)
+    total_ability = db.Column(db.Float, nullable=False, default=0.0)   # sum of respondents' ability estimates
+    p_value = db.Column(db.Float)
+    mean_time = db.Column(db.Float)
+
+class JobState(db.Model):
+    __tablename__ = "job_state"
+    name = db.Column(db.String, primary_key=True)
+    value = db.Column(db.Integer, nullable=False)   # e.g. last response id a job has processed
+
+# Offline test packs already recorded by /submit_batch, so a retried upload is not counted twice
+class SubmittedBatch(db.Model):
+    __tablename__ = "submitted_batch"
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'), primary_key=True)
+    batch_id = db.Column(db.String, primary_key=True)   # chosen by the client, one per pack
+    result = db.Column(db.JSON, nullable=False)   # {results, next_difficulty} as first returned
+
+# ---------------- Question Bank Index ----------------
+class QuestionBank:
     """
-    If DB exists but schema is older (missing subject), delete DB and recreate.
-    This is a pragmatic choice for dev/hackathon. In production use migrations.
+    In-process index of question ids bucketed by (difficulty, subject).
+    Sampling draws a random slot across the matching buckets and retries when the
+    id was already used, so a pick is O(1) expected instead of a full-table
+    ORDER BY random(). Buckets use swap-remove so patches are O(1) as well.
     """
-    if not os.path.exists(DB_FILE):
-        return  # will be created later
+    SAMPLE_TRIES = 16
 
-    # inspect columns in question table
-    from sqlalchemy import create_engine
-    engine = create_engine(f"sqlite:///{DB_FILE}")
-    inspector = inspect(engine)
-    if 'question' not in inspector.get_table_names():
-        return
-    cols = [c['name'] for c in inspector.get_columns('question')]
-    # if subject column missing, recreate DB
-    if 'subject' not in cols:
-        print("-> Existing DB schema is old (missing 'subject'). Recreating DB (deleting data.db).")
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}   # (difficulty, subject) -> [question id, ...]
+        self._slots = {}     # question id -> ((difficulty, subject), position)
+        self._payloads = {}  # question id -> serialized /next_question body, for any id served (not only indexed ones)
+        self._generation = 0  # bumped whenever cached payloads may have gone stale
+        self._items = None   # (ids, a, b) NumPy arrays for the IRT engine, rebuilt after any change
+        self._loaded = False
+        self._version = None  # question_version counter last seen (see sync)
+        self._checked = 0.0
+
+    def load(self):
+        rows = db.session.query(Question.id, Question.difficulty, Question.subject).all()
+        buckets, slots = {}, {}
+        for qid, diff, subj in rows:
+            bucket = buckets.setdefault((diff, subj), [])
+            slots[qid] = ((diff, subj), len(bucket))
+            bucket.append(qid)
+        with self._lock:
+            self._buckets, self._slots, self._loaded = buckets, slots, True
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+            self._generation += 1
+            self._buckets, self._slots, self._payloads, self._items = {}, {}, {}, None
+
+    def sync(self):
+        """
+        Drop everything if any process (another worker, an import or calibrate run)
+        changed the question table since the last look. The change counter is kept
+        by triggers, so this costs one primary-key read per CACHE_SYNC_INTERVAL.
+        """
+        now = time.monotonic()
+        if now - self._checked < current_app.config['CACHE_SYNC_INTERVAL']:
+            return
+        self._checked = now
+        version = db.session.execute(select(JobState.value).where(JobState.name == QUESTION_VERSION)).scalar() or 0
+        if version != self._version:
+            self.invalidate()
+            self._version = version
+
+    def add(self, qid, difficulty, subject):
+        with self._lock:
+            self._items = None
+            self._forget_payload(qid)
+            if not self._loaded:
+                return  # next ensure_loaded() picks it up
+            self._discard(qid)
+            key = (difficulty, subject)
+            bucket = self._buckets.setdefault(key, [])
+            self._slots[qid] = (key, len(bucket))
+            bucket.append(qid)
+
+    def remove(self, qid):
+        with self._lock:
+            self._items = None
+            self._forget_payload(qid)
+            if self._loaded:
+                self._discard(qid)
+
+    def difficulty(self, qid):
+        """Difficulty of a banked question, None once it has been removed."""
+        self.ensure_loaded()   # an empty index after a restart or invalidate() is not a removal
+        entry = self._slots.get(qid)
+        return entry[0][0] if entry else None
+
+    def item_arrays(self):
+        """(ids, a, b) over the whole bank, ids ascending, for vectorized item selection."""
+        items = self._items
+        if items is None:
+            generation = self._generation
+            rows = db.session.query(Question.id, Question.irt_a, Question.irt_b, Question.difficulty)\
+                .order_by(Question.id).all()
+            table = np.array(rows, dtype=float).reshape(-1, 4)   # NULL -> nan
+            a = np.where(np.isnan(table[:, 1]), 1.0, table[:, 1])
+            b = np.where(np.isnan(table[:, 2]), table[:, 3] - 3.0, table[:, 2])
+            items = (table[:, 0].astype(np.int64), a, b)
+            with self._lock:
+                if generation == self._generation:
+                    self._items = items
+        return items
+
+    def payload(self, qid):
+        """JSON bytes for a question, serialized once and reused until the row changes."""
+        body = self._payloads.get(qid)
+        if body is None:
+            generation = self._generation
+            q = db.session.get(Question, qid)
+            body = json.dumps(question_payload(q), separators=(',', ':')).encode()
+            with self._lock:
+                if generation == self._generation:   # no change committed while we read the row
+                    self._payloads[qid] = body
+        return body
+
+    def _forget_payload(self, qid):
+        self._generation += 1
+        self._payloads.pop(qid, None)
+
+    def _discard(self, qid):
+        entry = self._slots.pop(qid, None)
+        if entry is None:
+            return
+        key, pos = entry
+        bucket = self._buckets[key]
+        last = bucket.pop()
+        if last != qid:
+            bucket[pos] = last
+            self._slots[last] = (key, pos)
+        if not bucket:
+            del self._buckets[key]
+
+    def sample(self, lo=None, hi=None, exclude=(), subject=None):
+        """Random question id with lo <= difficulty <= hi (and subject), not in exclude."""
+        with self._lock:
+            lists = [b for (d, s), b in self._buckets.items()
+                     if (lo is None or d >= lo) and (hi is None or d <= hi)
+                     and (subject is None or s == subject)]
+            total = sum(len(b) for b in lists)
+            if not total:
+                return None
+            for _ in range(self.SAMPLE_TRIES):
+                k = random.randrange(total)
+                for b in lists:
+                    if k < len(b):
+                        qid = b[k]
+                        break
+                    k -= len(b)
+                if qid not in exclude:
+                    return qid
+            # session has seen most of this range: fall back to an explicit scan
+            remaining = [qid for b in lists for qid in b if qid not in exclude]
+            return random.choice(remaining) if remaining else None
+
+question_bank = _per_app('question_bank')
+
+def pick_question_id(target_diff, used=()):
+    """Same fallback order as before: +/-1 difficulty unused, any unused, any."""
+    question_bank.ensure_loaded()
+    qid = question_bank.sample(max(1, target_diff-1), min(5, target_diff+1), exclude=used)
+    if qid is None:
+        qid = question_bank.sample(exclude=used)
+    if qid is None:
+        qid = question_bank.sample()
+    return qid
+
+# keep the index in step with committed changes to the question table
+@event.listens_for(db.session, 'after_flush')
+def _collect_question_changes(session, flush_context):
+    changes = session.info.setdefault('question_changes', [])
+    for obj in session.new:
+        if isinstance(obj, Question):
+            changes.append(('add', obj.id, obj.difficulty, obj.subject))
+    for obj in session.dirty:
+        if isinstance(obj, Question) and session.is_modified(obj):
+            changes.append(('add', obj.id, obj.difficulty, obj.subject))
+    for obj in session.deleted:
+        if isinstance(obj, Question):
+            changes.append(('remove', obj.id, None, None))
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_question_changes(session):
+    for op, qid, diff, subj in session.info.pop('question_changes', []):
+        if op == 'add':
+            question_bank.add(qid, diff, subj)
+        else:
+            question_bank.remove(qid)
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_question_changes(session):
+    session.info.pop('question_changes', None)
+
+# ... and bump a counter on every change, from any process, for QuestionBank.sync
+QUESTION_VERSION = 'question_version'   # JobState row
+QUESTION_VERSION_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS question_version_{name} AFTER {op} ON question BEGIN "
+    f"INSERT INTO job_state (name, value) VALUES ('{QUESTION_VERSION}', 1) "
+    f"ON CONFLICT (name) DO UPDATE SET value = value + 1; END"
+    for name, op in (('insert', 'INSERT'), ('delete', 'DELETE'),
+                     ('update', 'UPDATE OF text, options, answer, difficulty, subject, irt_a, irt_b'))]
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_question_version_triggers(target, conn, **kw):
+    for ddl in QUESTION_VERSION_TRIGGERS:
+        conn.exec_driver_sql(ddl)
+
+# ---------------- Session State Cache ----------------
+RECENT_WINDOW = 7   # answers used for rolling accuracy
+
+class SessionState:
+    """
+    Compact adaptive state for one session: a ring buffer of the last
+    RECENT_WINDOW answers, the ids already served and running totals.
+    Recording an answer and choosing the next difficulty are both O(1).
+    """
+    __slots__ = ('recent', 'head', 'filled', 'recent_correct', 'used',
+                 'attempts', 'correct', 'total_time', 'total_difficulty',
+                 'loglik', 'theta', 'se')
+
+    def __init__(self):
+        self.recent = bytearray(RECENT_WINDOW)
+        self.head = 0
+        self.filled = 0
+        self.recent_correct = 0
+        self.used = set()   # sparse: a dense bitset would cost bank_size/8 bytes per session
+        self.attempts = 0
+        self.correct = 0
+        self.total_time = 0.0
+        self.total_difficulty = 0
+        self.loglik = None   # IRT log-likelihood over IRT_GRID, allocated on first use
+        self.theta = 0.0
+        self.se = None
+
+    def record(self, question_id, correct, difficulty, time_taken):
+        bit = 1 if correct else 0
+        if self.filled == RECENT_WINDOW:
+            self.recent_correct -= self.recent[self.head]
+        else:
+            self.filled += 1
+        self.recent[self.head] = bit
+        self.recent_correct += bit
+        self.head = (self.head + 1) % RECENT_WINDOW
+        self.used.add(question_id)
+        self.attempts += 1
+        self.correct += bit
+        self.total_time += time_taken or 0.0
+        self.total_difficulty += difficulty or 0
+
+    def branch(self):
+        """Copy of just the rolling window, for simulating answers ahead (test packs)."""
+        other = SessionState()
+        other.recent[:] = self.recent
+        other.head, other.filled, other.recent_correct = self.head, self.filled, self.recent_correct
+        return other
+
+    def recent_accuracy(self):
+        return self.recent_correct / self.filled if self.filled else 0.0
+
+    def stats(self):
+        """Running totals in the same shape/rounding as the /teacher/analytics fields."""
+        n = self.attempts
+        out = {
+            'attempts': n,
+            'avg_time': round(self.total_time/n, 2) if n else 0,
+            'accuracy': round(self.correct/n, 2) if n else 0,
+            'avg_difficulty': round(self.total_difficulty/n, 2) if n else 0,
+        }
+        if self.se is not None:   # IRT engine
+            out.update(theta=round(self.theta, 3), se=round(self.se, 3),
+                       precise=self.se <= current_app.config['IRT_TARGET_SE'])
+        return out
+
+    def update_ability(self, a, b, correct):
+        """EAP ability update after one 2PL item; O(len(IRT_GRID))."""
+        if self.loglik is None:
+            self.loglik = IRT_LOG_PRIOR.copy()
+        p = 1.0 / (1.0 + np.exp(-a * (IRT_GRID - b)))
+        self.loglik += np.log(p if correct else 1.0 - p)
+        self._posterior()
+
+    def replay_abilities(self, a, b, correct):
+        """Rebuild the likelihood from arrays of past items in one vectorized pass."""
+        p = 1.0 / (1.0 + np.exp(-a[:, None] * (IRT_GRID[None, :] - b[:, None])))
+        self.loglik = IRT_LOG_PRIOR + np.where(correct[:, None], np.log(p), np.log(1.0 - p)).sum(axis=0)
+        self._posterior()
+
+    def _posterior(self):
+        post = np.exp(self.loglik - self.loglik.max())
+        post /= post.sum()
+        self.theta = float(post @ IRT_GRID)
+        self.se = float(np.sqrt(post @ (IRT_GRID - self.theta) ** 2))
+
+    def next_difficulty(self, current):
+        acc = self.recent_accuracy()
+        if acc >= 0.85:
+            return min(5, current + 1)
+        if acc >= 0.6:
+            return current
+        return max(1, current - 1)
+
+class SessionStateStore:
+    """Bounded LRU of SessionState; cold or evicted sessions are rebuilt from the response table."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = OrderedDict()
+
+    def get(self, session_id):
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is not None:
+                self._states.move_to_end(session_id)
+        if state is not None and (not current_app.config['MULTI_PROCESS'] or self._current(session_id, state)):
+            return state
+        return self._put(session_id, self._load(session_id), replace=state is not None)   # stale copy
+
+    def create(self, session_id):
+        """Register a brand-new session without touching the database."""
+        return self._put(session_id, SessionState())
+
+    def discard(self, session_id):
+        with self._lock:
+            self._states.pop(session_id, None)
+
+    def _put(self, session_id, state, replace=False):
+        capacity = current_app.config['SESSION_STATE_CAPACITY']
+        with self._lock:
+            if replace:
+                self._states[session_id] = state
+            else:
+                state = self._states.setdefault(session_id, state)
+            self._states.move_to_end(session_id)
+            while len(self._states) > capacity:
+                self._states.popitem(last=False)
+        return state
+
+    def _current(self, session_id, state):
+        """Another worker may have served this session since we cached it: compare answer counts."""
+        response_writer.flush()
+        attempts = db.session.execute(select(SessionStats.attempts)
+                                      .where(SessionStats.session_id == session_id)).scalar() or 0
+        return attempts == state.attempts
+
+    def _load(self, session_id):
+        response_writer.flush()   # queued write-behind rows must be visible to the replay
+        state = SessionState()
+        rows = response_archive.session_rows(session_id) + \
+            db.session.query(Response.question_id, Response.correct, Response.difficulty, Response.time_taken)\
+            .filter_by(session_id=session_id).order_by(Response.id).all()
+        for qid, correct, diff, t in rows:
+            state.record(qid, correct, diff, t)
+        if rows and current_app.config['ADAPTIVE_ENGINE'] == 'irt':
+            adaptive_engine().replay(state, rows)
+        return state
+
+session_states = _per_app('session_states')
+
+# ---------------- Adaptive Engines ----------------
+# Ability grid and standard-normal log prior for EAP estimation
+IRT_GRID = np.linspace(-4.0, 4.0, 81) if np is not None else None
+IRT_LOG_PRIOR = -0.5 * IRT_GRID ** 2 if np is not None else None
+
+def item_params(q):
+    """(a, b) for a Question, with the uncalibrated defaults."""
+    a = q.irt_a if q.irt_a is not None else 1.0
+    b = q.irt_b if q.irt_b is not None else q.difficulty - 3.0
+    return a, b
+
+class HeuristicEngine:
+    """The original rule: +/-1 difficulty on accuracy over the last 7 answers."""
+
+    def after_answer(self, state, q, correct):
+        return state.next_difficulty(q.difficulty)
+
+    def pick(self, state, target_diff):
+        return pick_question_id(target_diff, state.used)
+
+    def replay(self, state, rows):
+        pass
+
+class IRTEngine:
+    """
+    2PL item response theory: an EAP ability estimate per session, updated after
+    each answer, and maximum Fisher information item selection computed with
+    NumPy over the whole bank in one pass. Picks uniformly among the IRT_TOP_K
+    most informative unused items so strong items are not over-exposed.
+    """
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("ADAPTIVE_ENGINE='irt' needs numpy installed")
+
+    def after_answer(self, state, q, correct):
+        a, b = item_params(q)
+        state.update_ability(a, b, correct)
+        return self.difficulty_for(state.theta)
+
+    def pick(self, state, target_diff):
+        ids, a, b = question_bank.item_arrays()
+        if not len(ids):
+            return None
+        p = 1.0 / (1.0 + np.exp(-a * (state.theta - b)))
+        info = a * a * p * (1.0 - p)
+        if state.used:
+            used = np.fromiter(state.used, dtype=np.int64, count=len(state.used))
+            pos = np.searchsorted(ids, used).clip(0, len(ids) - 1)
+            info[pos[ids[pos] == used]] = -1.0
+            if info.max() < 0:   # whole bank used: same last resort as the heuristic
+                return pick_question_id(target_diff)
+        k = min(current_app.config['IRT_TOP_K'], len(ids))
+        top = np.argpartition(info, -k)[-k:]
+        top = top[info[top] >= 0]
+        return int(ids[random.choice(top)])
+
+    def replay(self, state, rows):
+        qids = [r[0] for r in rows]
+        ids, a, b = question_bank.item_arrays()
+        pos = np.searchsorted(ids, qids).clip(0, max(len(ids) - 1, 0))
+        known = ids[pos] == np.asarray(qids)   # items deleted since are skipped
+        correct = np.array([bool(r[1]) for r in rows])
+        if known.any():
+            state.replay_abilities(a[pos][known], b[pos][known], correct[known])
+
+    @staticmethod
+    def difficulty_for(theta):
+        return int(min(5, max(1, round(theta + 3))))
+
+ENGINES = {'heuristic': HeuristicEngine, 'irt': IRTEngine}
+_engines = {}
+
+def adaptive_engine():
+    name = current_app.config['ADAPTIVE_ENGINE']
+    engine = _engines.get(name)
+    if engine is None:
+        engine = _engines[name] = ENGINES[name]()
+    return engine
+
+# ---------------- Analytics Aggregates ----------------
+def _session_stats_upsert():
+    stmt = sqlite_insert(SessionStats)
+    return stmt.on_conflict_do_update(index_elements=['session_id'], set_={
+        'attempts': SessionStats.attempts + stmt.excluded.attempts,
+        'correct': SessionStats.correct + stmt.excluded.correct,
+        'total_time': SessionStats.total_time + stmt.excluded.total_time,
+        'total_difficulty': SessionStats.total_difficulty + stmt.excluded.total_difficulty,
+    })
+
+def _subject_stats_upsert():
+    stmt = sqlite_insert(SubjectStats)
+    return stmt.on_conflict_do_update(index_elements=['session_id', 'subject'], set_={
+        'attempts': SubjectStats.attempts + stmt.excluded.attempts,
+        'correct': SubjectStats.correct + stmt.excluded.correct,
+    })
+
+SESSION_STATS_UPSERT = _session_stats_upsert()
+SUBJECT_STATS_UPSERT = _subject_stats_upsert()
+
+def bump_session_stats(rows, conn=None):
+    """Upsert the per-session and per-(session, subject) counters for Response rows (dicts); caller commits."""
+    conn = conn or db.session
+    conn.execute(SESSION_STATS_UPSERT, [
+        {'session_id': r['session_id'], 'attempts': 1, 'correct': 1 if r['correct'] else 0,
+         'total_time': r['time_taken'], 'total_difficulty': r['difficulty']} for r in rows])
+    conn.execute(SUBJECT_STATS_UPSERT, [
+        {'session_id': r['session_id'], 'subject': r['subject'], 'attempts': 1,
+         'correct': 1 if r['correct'] else 0} for r in rows])
+
+def backfill_session_stats(conn):
+    """Build aggregates for sessions answered before the aggregate tables existed."""
+    conn.execute(text(
+        "INSERT INTO session_stats (session_id, attempts, correct, total_time, total_difficulty) "
+        "SELECT session_id, count(*), sum(correct), coalesce(sum(time_taken), 0), coalesce(sum(difficulty), 0) "
+        "FROM response WHERE session_id NOT IN (SELECT session_id FROM session_stats) GROUP BY session_id"))
+    conn.execute(text(
+        "INSERT INTO session_subject_stats (session_id, subject, attempts, correct) "
+        "SELECT session_id, subject, count(*), sum(correct) "
+        "FROM response WHERE session_id NOT IN (SELECT DISTINCT session_id FROM session_subject_stats) "
+        "GROUP BY session_id, subject ORDER BY min(id)"))
+
+def analytics_row(s, st, subjects):
+    """One /teacher/analytics entry from a Session, its SessionStats (or None) and its SubjectStats rows."""
+    attempts = st.attempts if st else 0
+    if attempts == 0:
+        avg_time = 0
+        accuracy = 0
+        avg_diff = 0
+        focus = []
+    else:
+        avg_time = st.total_time/attempts
+        accuracy = st.correct/attempts
+        avg_diff = st.total_difficulty/attempts
+        focus = []
+        for ss in subjects:
+            acc = ss.correct/ss.attempts if ss.attempts>0 else 0
+            if acc < 0.6:
+                focus.append({'subject': ss.subject, 'accuracy': round(acc,2), 'attempts': ss.attempts})
+    return {
+        'session_id': s.id,
+        'student': s.student,
+        'roll_no': s.roll_no,
+        'attempts': attempts,
+        'avg_time': round(avg_time,2),
+        'accuracy': round(accuracy,2),
+        'avg_difficulty': round(avg_diff,2),
+        'focus_areas': focus
+    }
+
+def analytics_rows(pairs):
+    """analytics_row() for a page of (Session, SessionStats) pairs with one subject query."""
+    by_session = {}
+    ids = [s.id for s, _ in pairs]
+    if ids:
+        for ss in SubjectStats.query.filter(SubjectStats.session_id.in_(ids)).order_by(SubjectStats.id):
+            by_session.setdefault(ss.session_id, []).append(ss)
+    return [analytics_row(s, st, by_session.get(s.id, [])) for s, st in pairs]
+
+# ---------------- Write-Behind Responses ----------------
+class ResponseWriter:
+    """
+    Optional write-behind for graded responses (WRITE_BEHIND). Rows are queued and a
+    background thread commits them, with their aggregate updates, in batches of up to
+    WRITE_BEHIND_BATCH rows or every WRITE_BEHIND_INTERVAL seconds, so a burst of
+    answers shares one transaction and one fsync.
+
+    WRITE_BEHIND_DURABILITY='group' makes submit() wait until its batch is committed
+    (group commit: nothing acknowledged is lost). 'async' returns at once and can lose
+    the last interval of answers if the process dies. flush() gives readers
+    read-your-writes; it also runs at interpreter exit.
+
+    A batch that hits a lock timeout is retried WRITE_BEHIND_RETRIES times. A row
+    that cannot be written is logged and dropped (a bad row is isolated by
+    bisecting its batch; a database-level error or a lock that outlasts the
+    retries drops the whole batch) and a submit() waiting on it raises. Waits are
+    bounded by WRITE_BEHIND_TIMEOUT in case the writer thread itself is stuck.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = []
+        self._queued = 0     # rows ever queued
+        self._written = 0    # rows ever committed or dropped
+        self._waiting = set()  # tickets group-mode submit() calls are waiting on
+        self._failed = set()   # ... of those, the ones whose row was dropped
+        self._flushers = 0
+        self._closing = False
+        self._thread = None
+
+    def submit(self, row):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(current_app._get_current_object(),),
+                                                name='response-writer', daemon=True)
+                self._thread.start()
+            self._pending.append(row)
+            self._queued += 1
+            ticket = self._queued
+            if len(self._pending) >= current_app.config['WRITE_BEHIND_BATCH']:
+                self._cond.notify_all()
+            if current_app.config['WRITE_BEHIND_DURABILITY'] == 'group':
+                self._waiting.add(ticket)
+                try:
+                    self._wait_for(ticket)
+                finally:
+                    self._waiting.discard(ticket)
+                if ticket in self._failed:
+                    self._failed.discard(ticket)
+                    raise RuntimeError("response could not be recorded")
+
+    def flush(self):
+        """Block until everything queued so far is committed (or dropped)."""
+        with self._cond:
+            if self._thread is None:
+                return
+            ticket = self._queued
+            self._flushers += 1
+            self._cond.notify_all()
+            try:
+                self._wait_for(ticket)
+            finally:
+                self._flushers -= 1
+
+    def _wait_for(self, ticket):
+        """With _cond held: wait until rows up to ticket are written or dropped."""
+        deadline = time.monotonic() + current_app.config['WRITE_BEHIND_TIMEOUT']
+        while self._written < ticket:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RuntimeError(f"write-behind queue stalled ({self._queued - self._written} rows pending)")
+            self._cond.wait(remaining)
+
+    def close(self):
+        with self._cond:
+            if self._thread is None:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self, app):
+        with app.app_context():
+            batch = app.config['WRITE_BEHIND_BATCH']
+            interval = app.config['WRITE_BEHIND_INTERVAL']
+            # own connection, so a pool full of requests waiting on this thread cannot starve it
+            engine = create_engine(db.engine.url, poolclass=StaticPool, connect_args={'check_same_thread': False})
+            while True:
+                with self._cond:
+                    deadline = time.monotonic() + interval
+                    while len(self._pending) < batch and not (self._flushers or self._closing):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    rows, self._pending = self._pending, []
+                    closing = self._closing
+                    first = self._written + 1   # batches are written in queue order, so tickets are consecutive
+                if rows:
+                    dropped = self._write(engine, rows)
+                    with self._cond:
+                        self._failed.update(first + i for i in dropped if first + i in self._waiting)
+                        self._written += len(rows)
+                        self._cond.notify_all()
+                elif closing:
+                    engine.dispose()
+                    return
+
+    def _write(self, engine, rows):
+        """Commit rows; returns the indexes of the rows dropped."""
+        retries = current_app.config['WRITE_BEHIND_RETRIES']
+        while True:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(Response.__table__.insert(), rows)
+                    bump_session_stats(rows, conn)
+                return []
+            except OperationalError as e:
+                if is_lock_timeout(e) and retries > 0:
+                    retries -= 1
+                    current_app.logger.warning("write-behind flush of %d responses hit a lock timeout, retrying", len(rows))
+                    time.sleep(0.5)
+                    continue
+                # disk full, read-only, schema missing or still locked: no row of the batch can go in
+                current_app.logger.exception("write-behind dropped %d responses", len(rows))
+                for sid in {r['session_id'] for r in rows}:
+                    session_states.discard(sid)
+                return list(range(len(rows)))
+            except Exception:
+                if len(rows) == 1:
+                    current_app.logger.exception("write-behind dropped response %r", rows[0])
+                    session_states.discard(rows[0]['session_id'])   # its in-memory state already counts the row
+                    return [0]
+                break
+        # bisect down to the bad row(s) and commit the rest
+        half = len(rows) // 2
+        return self._write(engine, rows[:half]) + [half + i for i in self._write(engine, rows[half:])]
+
+response_writer = _per_app('response_writer')
+
+def is_lock_timeout(exc):
+    """SQLITE_BUSY / SQLITE_LOCKED, the only OperationalErrors that go away by waiting."""
+    orig = getattr(exc, 'orig', exc)
+    code = getattr(orig, 'sqlite_errorcode', None)
+    if code is None:
+        return 'locked' in str(orig) or 'busy' in str(orig)
+    return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+# ---------------- Schema Migrations ----------------
+SCHEMA_VERSION = 8   # stored in PRAGMA user_version
+
+def _migrate_v1(conn):
+    """Pre-versioned databases: add the subject columns and build analytics aggregates."""
+    for table in ('question', 'response'):
+        cols = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+        if cols and 'subject' not in cols:
+            extra = " NOT NULL DEFAULT 'General'" if table == 'question' else ""
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN subject VARCHAR{extra}")
+    conn.exec_driver_sql("UPDATE response SET subject = (SELECT subject FROM question WHERE question.id = response.question_id) "
+                         "WHERE subject IS NULL")
+    backfill_session_stats(conn)
+
+def _migrate_v2(conn):
+    """Question.options: str(list) -> JSON."""
+    updates = []
+    for qid, raw in conn.exec_driver_sql("SELECT id, options FROM question").fetchall():
         try:
-            engine.dispose()
-        except:
-            pass
-        os.remove(DB_FILE)
+            json.loads(raw)
+        except ValueError:
+            updates.append({'id': qid, 'options': json.dumps(ast.literal_eval(raw))})
+    if updates:
+        conn.execute(text("UPDATE question SET options = :options WHERE id = :id"), updates)
+
+def _migrate_v3(conn):
+    """Question.external_id for idempotent imports."""
+    conn.exec_driver_sql("ALTER TABLE question ADD COLUMN external_id VARCHAR")
+    conn.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_question_external_id ON question (external_id)")
+
+def _migrate_v4(conn):
+    """Hot-path covering indexes."""
+    # spelled out rather than taken from db.metadata, which also holds indexes on columns later steps add
+    for ddl in ("CREATE INDEX IF NOT EXISTS ix_question_bank ON question (difficulty, subject, id)",
+                "CREATE INDEX IF NOT EXISTS ix_response_session ON response "
+                "(session_id, id, question_id, correct, difficulty, time_taken)",
+                "CREATE INDEX IF NOT EXISTS ix_session_student ON session (student)",
+                "CREATE INDEX IF NOT EXISTS ix_session_roll_no ON session (roll_no)",
+                "CREATE INDEX IF NOT EXISTS ix_session_created_at ON session (created_at)"):
+        conn.exec_driver_sql(ddl)
+    conn.exec_driver_sql("ANALYZE")
+
+def _migrate_v5(conn):
+    """IRT item parameters (NULL until calibrated)."""
+    conn.exec_driver_sql("ALTER TABLE question ADD COLUMN irt_a FLOAT")
+    conn.exec_driver_sql("ALTER TABLE question ADD COLUMN irt_b FLOAT")
+
+def _migrate_v6(conn):
+    """Question change counter for cross-process cache invalidation."""
+    for ddl in QUESTION_VERSION_TRIGGERS:
+        conn.exec_driver_sql(ddl)
+
+def _migrate_v7(conn):
+    """Session.token / first_question_id for bulk-provisioned sessions."""
+    conn.exec_driver_sql("ALTER TABLE session ADD COLUMN token VARCHAR")
+    conn.exec_driver_sql("ALTER TABLE session ADD COLUMN first_question_id INTEGER")
+    conn.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ix_session_token ON session (token)")
+
+def _migrate_v8(conn):
+    """submitted_batch for idempotent /submit_batch retries."""
+    conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS submitted_batch (session_id INTEGER NOT NULL, batch_id VARCHAR NOT NULL, "
+                         "result JSON NOT NULL, PRIMARY KEY (session_id, batch_id), FOREIGN KEY(session_id) REFERENCES session (id))")
+
+MIGRATIONS = [(1, _migrate_v1), (2, _migrate_v2), (3, _migrate_v3), (4, _migrate_v4), (5, _migrate_v5),
+              (6, _migrate_v6), (7, _migrate_v7), (8, _migrate_v8)]
+
+def migrate_db():
+    """
+    Create missing tables and upgrade an existing data.db in place, one
+    transaction per step, recording progress in PRAGMA user_version.
+    A current database costs a single PRAGMA read.
+    """
+    with db.engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        fresh = version == 0 and \
+            conn.exec_driver_sql("SELECT count(*) FROM sqlite_master WHERE name = 'question'").scalar() == 0
+    if version >= SCHEMA_VERSION:
+        return
+    db.create_all()
+    if fresh:
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
         return
+    for version, step in MIGRATIONS:
+        with db.engine.begin() as conn:
+            if conn.exec_driver_sql("PRAGMA user_version").scalar() >= version:
+                continue
+            print(f"-> Migrating database schema to version {version}.")
+            step(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {version}")
+    question_bank.invalidate()
+
+_schema_lock = threading.Lock()
+
+@bp.before_app_request
+def _ensure_schema():
+    """Schema check on an app's first request rather than at import or create_app time."""
+    if current_app.extensions.get('assessment_schema'):
+        return
+    with _schema_lock:
+        if not current_app.extensions.get('assessment_schema'):
+            migrate_db()
+            current_app.extensions['assessment_schema'] = True
 
 # ---------------- Seed 70 Questions ----------------
+SEED_SUBJECTS = ['Maths', 'Physics', 'Chemistry', 'General']
+# Difficulty distribution: 1 → very easy, 2 → easy-medium, 3 → medium, 4 → advanced, 5 → high-level
+SEED_DISTRIBUTION = [(1, 10), (2, 10), (3, 10), (4, 10), (5, 30)]
+
+def template_question(subj, diff, i, idx):
+    """Seed template for one (subject, difficulty) item; i varies the numbers, idx labels it."""
+    if subj == 'Maths':
+        if diff == 1:
+            text = f"Maths Q{idx}: What is {i+1} + {i+2}?"
+            opts = [str(i+2), str(i+3), str(i+4), str(i+5)]
+            ans = str(i+3)
+        elif diff == 2:
+            text = f"Maths Q{idx}: Multiply {i+2} * {i+3}"
+            opts = [str((i+2)*(i+3)), str((i+2)*(i+4)), str((i+3)*(i+3)), str((i+1)*(i+3))]
+            ans = str((i+2)*(i+3))
+        elif diff == 3:
+            text = f"Maths Q{idx}: Solve for x: 2x + {i+1} = {i+5}"
+            opts = [str((i+5-(i+1))//2), str((i+5+i+1)//2), str(i), str(i+1)]
+            ans = str((i+5-(i+1))//2)
+        elif diff == 4:
+            text = f"Maths Q{idx}: Derivative of x^{i+1}?"
+            opts = [f"{i+1}*x^{i}", f"{i}*x^{i-1}", f"x^{i+1}", f"1"]
+            ans = f"{i+1}*x^{i}"
+        else:
+            text = f"Maths Q{idx}: High-level concept question about calculus."
+            opts = ["Proof/Explain", "Calculate", "Estimate", "None"]
+            ans = "Proof/Explain"
+
+    elif subj == 'Physics':
+        if diff <= 2:
+            text = f"Physics Q{idx}: SI unit of Force?"
+            opts = ["Newton","Joule","Pascal","Watt"]
+            ans = "Newton"
+        elif diff == 3:
+            text = f"Physics Q{idx}: Speed of light (approx)?"
+            opts = ["3e8 m/s","3e6 m/s","3e5 km/s","9.8 m/s^2"]
+            ans = "3e8 m/s"
+        elif diff == 4:
+            text = f"Physics Q{idx}: Newton's 2nd law formula?"
+            opts = ["F=ma","E=mc^2","P=mv","V=IR"]
+            ans = "F=ma"
+        else:
+            text = f"Physics Q{idx}: Research-level question on quantum mechanics."
+            opts = ["Explain","Derive","Sketch","None"]
+            ans = "Derive"
+
+    elif subj == 'Chemistry':
+        if diff <= 2:
+            text = f"Chemistry Q{idx}: Water's chemical formula?"
+            opts = ["H2O","CO2","O2","H2"]
+            ans = "H2O"
+        elif diff == 3:
+            text = f"Chemistry Q{idx}: Atomic number of Carbon?"
+            opts = ["6","12","8","14"]
+            ans = "6"
+        elif diff == 4:
+            text = f"Chemistry Q{idx}: Boiling point of water?"
+            opts = ["100°C","90°C","80°C","120°C"]
+            ans = "100°C"
+        else:
+            text = f"Chemistry Q{idx}: High-level question on chemical reactions."
+            opts = ["Explain","Calculate","Predict","None"]
+            ans = "Explain"
+
+    else:  # General
+        if diff <= 2:
+            text = f"General Q{idx}: Capital of France?"
+            opts = ["Paris","London","Berlin","Rome"]
+            ans = "Paris"
+        elif diff == 3:
+            text = f"General Q{idx}: 5 + 7 * 2 = ?"
+            opts = ["19","24","26","17"]
+            ans = "19"
+        elif diff == 4:
+            text = f"General Q{idx}: Largest ocean in the world?"
+            opts = ["Pacific","Atlantic","Indian","Arctic"]
+            ans = "Pacific"
+        else:
+            text = f"General Q{idx}: High-level reasoning question."
+            opts = ["Explain","Estimate","Predict","None"]
+            ans = "Explain"
+    return text + f" [{subj}]", opts, ans
+
 def seed_questions():
-    db.create_all()
     if Question.query.first():
         return
 
-    subjects = ['Maths', 'Physics', 'Chemistry', 'General']
     Qs = []
     idx = 1
 
-    # Difficulty distribution: 1 → very easy, 2 → easy-medium, 3 → medium, 4 → advanced, 5 → high-level
-    distribution = [(1, 10), (2, 10), (3, 10), (4, 10), (5, 30)]
-
-    for diff, count in distribution:
+    for diff, count in SEED_DISTRIBUTION:
         for i in range(count):
-            subj = random.choice(subjects)
-
-            if subj == 'Maths':
-                if diff == 1:
-                    text = f"Maths Q{idx}: What is {i+1} + {i+2}?"
-                    opts = [str(i+2), str(i+3), str(i+4), str(i+5)]
-                    ans = str(i+3)
-                elif diff == 2:
-                    text = f"Maths Q{idx}: Multiply {i+2} * {i+3}"
-                    opts = [str((i+2)*(i+3)), str((i+2)*(i+4)), str((i+3)*(i+3)), str((i+1)*(i+3))]
-                    ans = str((i+2)*(i+3))
-                elif diff == 3:
-                    text = f"Maths Q{idx}: Solve for x: 2x + {i+1} = {i+5}"
-                    opts = [str((i+5-(i+1))//2), str((i+5+i+1)//2), str(i), str(i+1)]
-                    ans = str((i+5-(i+1))//2)
-                elif diff == 4:
-                    text = f"Maths Q{idx}: Derivative of x^{i+1}?"
-                    opts = [f"{i+1}*x^{i}", f"{i}*x^{i-1}", f"x^{i+1}", f"1"]
-                    ans = f"{i+1}*x^{i}"
-                else:
-                    text = f"Maths Q{idx}: High-level concept question about calculus."
-                    opts = ["Proof/Explain", "Calculate", "Estimate", "None"]
-                    ans = "Proof/Explain"
-
-            elif subj == 'Physics':
-                if diff <= 2:
-                    text = f"Physics Q{idx}: SI unit of Force?"
-                    opts = ["Newton","Joule","Pascal","Watt"]
-                    ans = "Newton"
-                elif diff == 3:
-                    text = f"Physics Q{idx}: Speed of light (approx)?"
-                    opts = ["3e8 m/s","3e6 m/s","3e5 km/s","9.8 m/s^2"]
-                    ans = "3e8 m/s"
-                elif diff == 4:
-                    text = f"Physics Q{idx}: Newton's 2nd law formula?"
-                    opts = ["F=ma","E=mc^2","P=mv","V=IR"]
-                    ans = "F=ma"
-                else:
-                    text = f"Physics Q{idx}: Research-level question on quantum mechanics."
-                    opts = ["Explain","Derive","Sketch","None"]
-                    ans = "Derive"
-
-            elif subj == 'Chemistry':
-                if diff <= 2:
-                    text = f"Chemistry Q{idx}: Water's chemical formula?"
-                    opts = ["H2O","CO2","O2","H2"]
-                    ans = "H2O"
-                elif diff == 3:
-                    text = f"Chemistry Q{idx}: Atomic number of Carbon?"
-                    opts = ["6","12","8","14"]
-                    ans = "6"
-                elif diff == 4:
-                    text = f"Chemistry Q{idx}: Boiling point of water?"
-                    opts = ["100°C","90°C","80°C","120°C"]
-                    ans = "100°C"
-                else:
-                    text = f"Chemistry Q{idx}: High-level question on chemical reactions."
-                    opts = ["Explain","Calculate","Predict","None"]
-                    ans = "Explain"
-
-            else:  # General
-                if diff <= 2:
-                    text = f"General Q{idx}: Capital of France?"
-                    opts = ["Paris","London","Berlin","Rome"]
-                    ans = "Paris"
-                elif diff == 3:
-                    text = f"General Q{idx}: 5 + 7 * 2 = ?"
-                    opts = ["19","24","26","17"]
-                    ans = "19"
-                elif diff == 4:
-                    text = f"General Q{idx}: Largest ocean in the world?"
-                    opts = ["Pacific","Atlantic","Indian","Arctic"]
-                    ans = "Pacific"
-                else:
-                    text = f"General Q{idx}: High-level reasoning question."
-                    opts = ["Explain","Estimate","Predict","None"]
-                    ans = "Explain"
-
-            Qs.append((text + f" [{subj}]", opts, ans, diff, subj))
+            subj = random.choice(SEED_SUBJECTS)
+
+            text, opts, ans = template_question(subj, diff, i, idx)
+            Qs.append((text, opts, ans, diff, subj))
             idx += 1
 
     # Insert all questions into DB
     for t, opts, ans, diff, subj in Qs:
-        db.session.add(Question(text=t, options=str(opts), answer=str(ans), difficulty=diff, subject=subj))
+        db.session.add(Question(text=t, options=opts, answer=str(ans), difficulty=diff, subject=subj))
     db.session.commit()
     print(f"Seeded {len(Qs)} questions into the database.")
 
+@bp.cli.command('seed')
+def seed_command():
+    """Migrate the database and add the starter questions if the bank is empty."""
+    migrate_db()
+    seed_questions()
+
+# ---------------- Question Import ----------------
+QUESTION_FIELDS = ('external_id', 'text', 'options', 'answer', 'difficulty', 'subject')
+
+def read_question_rows(path, fmt):
+    """Yield (line number, raw row) from a CSV (header row) or JSONL file without loading it whole.
+    JSONL lines are yielded unparsed so a malformed line is rejected on its own by clean_question_row."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for n, row in enumerate(csv.DictReader(f), start=2):
+                yield n, row
+        else:
+            for n, line in enumerate(f, start=1):
+                if line.strip():
+                    yield n, line
+
+def clean_question_row(raw):
+    """Validate one imported row and return the insert dict; raises ValueError."""
+    if isinstance(raw, str):   # JSONL line
+        raw = json.loads(raw)
+    if not isinstance(raw, dict):
+        raise ValueError("row is not an object")
+    text_ = str(raw.get('text') or '').strip()
+    if not text_:
+        raise ValueError("missing text")
+    opts = raw.get('options')
+    if isinstance(opts, str):
+        # CSV: JSON array or 'a|b|c'
+        opts = json.loads(opts) if opts.lstrip().startswith('[') else opts.split('|')
+    if not isinstance(opts, list) or len(opts) < 2:
+        raise ValueError("options must be a list of at least 2 entries")
+    opts = [str(o).strip() for o in opts]
+    answer = str(raw.get('answer') or '').strip()
+    if answer.lower() not in (o.lower() for o in opts):
+        raise ValueError("answer is not one of the options")
+    diff = int(raw.get('difficulty') or 0)
+    if not 1 <= diff <= 5:
+        raise ValueError("difficulty must be 1..5")
+    subject = str(raw.get('subject') or '').strip()
+    if not subject:
+        raise ValueError("missing subject")
+    ext = raw.get('external_id')
+    return {'external_id': str(ext).strip() if ext not in (None, '') else None,
+            'text': text_, 'options': opts, 'answer': answer, 'difficulty': diff, 'subject': subject}
+
+def generate_question_rows(n, seed=0):
+    """N synthetic items from the seed templates, in the seed's difficulty proportions."""
+    rng = random.Random(seed)
+    weights = [count for _, count in SEED_DISTRIBUTION]
+    diffs = [diff for diff, _ in SEED_DISTRIBUTION]
+    for k in range(n):
+        diff = rng.choices(diffs, weights)[0]
+        subj = rng.choice(SEED_SUBJECTS)
+        text_, opts, ans = template_question(subj, diff, k % 50, k+1)
+        yield k+1, {'external_id': f"gen-{k+1}", 'text': text_, 'options': opts,
+                    'answer': ans, 'difficulty': diff, 'subject': subj}
+
+def import_question_rows(rows, chunk_size=5000):
+    """
+    Insert (line, raw) rows in executemany batches inside one transaction.
+    Rows with an external_id are upserted on it. Returns (imported, errors).
+    """
+    table = Question.__table__
+    upsert = sqlite_insert(table)
+    upsert = upsert.on_conflict_do_update(index_elements=['external_id'], set_={
+        c: upsert.excluded[c] for c in ('text', 'options', 'answer', 'difficulty', 'subject')})
+    plain = table.insert()
+    imported, errors = 0, []
+
+    def flush(conn, keyed, unkeyed):
+        if keyed:
+            conn.execute(upsert, keyed)
+        if unkeyed:
+            conn.execute(plain, unkeyed)
+
+    with db.engine.begin() as conn:
+        keyed, unkeyed = [], []
+        for line, raw in rows:
+            try:
+                row = clean_question_row(raw)
+            except (ValueError, TypeError) as e:
+                errors.append((line, str(e)))
+                continue
+            (keyed if row['external_id'] else unkeyed).append(row)
+            imported += 1
+            if len(keyed) + len(unkeyed) >= chunk_size:
+                flush(conn, keyed, unkeyed)
+                keyed, unkeyed = [], []
+        flush(conn, keyed, unkeyed)
+    question_bank.invalidate()   # Core inserts bypass the ORM change hooks
+    return imported, errors
+
+@bp.cli.command('import-questions')
+@click.argument('path', required=False)
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help="Defaults to the file extension.")
+@click.option('--chunk-size', default=5000, show_default=True)
+@click.option('--generate', type=int, help="Generate N synthetic questions instead of reading PATH.")
+@click.option('--seed', default=0, show_default=True, help="Random seed for --generate.")
+def import_questions_command(path, fmt, chunk_size, generate, seed):
+    """Bulk-load questions from CSV/JSONL (upsert by external_id) or generate a synthetic bank."""
+    migrate_db()
+    if generate:
+        rows = generate_question_rows(generate, seed)
+    elif path:
+        fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        rows = read_question_rows(path, fmt)
+    else:
+        raise click.UsageError("give a PATH or --generate N")
+    started = time.time()
+    imported, errors = import_question_rows(rows, chunk_size)
+    for line, msg in errors[:20]:
+        click.echo(f"  line {line}: {msg}", err=True)
+    if len(errors) > 20:
+        click.echo(f"  ... {len(errors) - 20} more", err=True)
+    click.echo(f"Imported {imported} questions ({len(errors)} rejected) in {time.time() - started:.1f}s.")
+
+
+# ---------------- Response Archive ----------------
+# Responses of closed sessions move out of SQLite into append-only columnar
+# segments, one directory per segment holding one .npy file per column plus
+# meta.json. Rows are sorted by (session_id, id), so one session is a
+# searchsorted slice and whole-log scans read the columns through mmap.
+ARCHIVE_COLUMNS = [('id', 'int64'), ('session_id', 'int64'), ('question_id', 'int64'), ('correct', 'bool'),
+                   ('difficulty', 'int16'), ('time_taken', 'float64'), ('subject', 'uint16')]   # subject: code into meta
+ARCHIVE_STATE = 'archive'   # JobState row: number of the last committed segment
+
+def _nan_to_none(values):
+    return [None if v != v else v for v in values.tolist()]
+
+def archive_dir():
+    return os.path.join(current_app.instance_path, current_app.config['ARCHIVE_DIR'])
+
+class ArchiveSegment:
+    __slots__ = ('number', 'meta', 'columns', 'subjects')
+
+    def __init__(self, path, number):
+        self.number = number
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name, _ in ARCHIVE_COLUMNS}
+        self.subjects = self.meta['subjects']
+
+    def rows(self, lo=0, hi=None):
+        """Export-shaped tuples for rows [lo, hi); NULLs were stored as 0/False/nan."""
+        c = self.columns
+        hi = self.meta['rows'] if hi is None else hi
+        subjects = [self.subjects[k] for k in c['subject'][lo:hi].tolist()]
+        return list(zip(c['id'][lo:hi].tolist(), c['session_id'][lo:hi].tolist(), c['question_id'][lo:hi].tolist(),
+                        c['correct'][lo:hi].tolist(), c['difficulty'][lo:hi].tolist(),
+                        _nan_to_none(c['time_taken'][lo:hi]), subjects))
+
+class ResponseArchive:
+    """
+    Read side of the archive. Segments are memory-mapped, never copied, and only
+    those the archive job has committed (JobState 'archive') are visible; the
+    committed number is re-read at most every CACHE_SYNC_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._segments = []
+        self._committed = None
+        self._checked = 0.0
+
+    def segments(self, refresh=False):
+        if np is None:
+            return []
+        now = time.monotonic()
+        if refresh or now - self._checked >= current_app.config['CACHE_SYNC_INTERVAL']:
+            self._checked = now
+            committed = db.session.execute(select(JobState.value).where(JobState.name == ARCHIVE_STATE)).scalar() or 0
+            if committed != self._committed:
+                loaded = {seg.number: seg for seg in self._segments}
+                path = archive_dir()
+                segments = [loaded.get(n) or ArchiveSegment(os.path.join(path, f"seg-{n:06d}"), n)
+                            for n in range(1, committed + 1)]
+                with self._lock:
+                    self._segments, self._committed = segments, committed
+        return self._segments
+
+    def session_rows(self, session_id):
+        """(question_id, correct, difficulty, time_taken) for one archived session, in id order."""
+        out = []
+        for seg in self.segments():
+            if not seg.meta['min_session'] <= session_id <= seg.meta['max_session']:
+                continue
+            c = seg.columns
+            lo, hi = np.searchsorted(c['session_id'], [session_id, session_id + 1])
+            out.extend(zip(c['question_id'][lo:hi].tolist(), c['correct'][lo:hi].tolist(),
+                           c['difficulty'][lo:hi].tolist(), _nan_to_none(c['time_taken'][lo:hi])))
+        return out
+
+response_archive = _per_app('response_archive')
+
+def _write_segment(path, table, subjects):
+    """Columns to path/ through a temp directory and a rename, so a segment appears whole or not at all."""
+    tmp = path + '.tmp'
+    os.makedirs(tmp, exist_ok=True)
+    for name, dtype in ARCHIVE_COLUMNS:
+        with open(os.path.join(tmp, f"{name}.npy"), 'wb') as f:
+            np.save(f, np.ascontiguousarray(table[name], dtype=dtype))
+            os.fsync(f.fileno())
+    meta = {'rows': len(table['id']), 'subjects': subjects,
+            'min_id': int(table['id'].min()), 'max_id': int(table['id'].max()),
+            'min_session': int(table['session_id'][0]), 'max_session': int(table['session_id'][-1])}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+        os.fsync(f.fileno())
+    os.rename(tmp, path)
+    return meta
+
+def archive_responses(before, segment_rows=500000):
+    """
+    Move responses of sessions created before `before` from SQLite into new
+    segments of up to segment_rows rows. Per segment: write the files, then in one
+    transaction delete the rows it holds and commit the segment number; a segment
+    left uncommitted by a crash is committed by the next run. Aggregates stay in
+    SQLite, so /teacher/analytics is unaffected. The session holding the newest
+    response is never archived, or SQLite could hand its ids out again.
+    Returns (rows archived, segments written).
+    """
+    if np is None:
+        raise RuntimeError("archiving needs numpy installed")
+    response_writer.flush()
+    path = archive_dir()
+    os.makedirs(path, exist_ok=True)
+    with db.engine.begin() as conn:
+        committed = conn.exec_driver_sql("SELECT value FROM job_state WHERE name = ?", (ARCHIVE_STATE,)).scalar() or 0
+    number = committed + 1
+    pending = os.path.join(path, f"seg-{number:06d}")
+    if os.path.isdir(pending):   # written, but the crash came before its delete committed
+        _commit_segment(ArchiveSegment(pending, number))
+        number += 1
+    if os.path.isdir(pending + '.tmp'):
+        shutil.rmtree(pending + '.tmp')
+
+    with db.engine.connect() as conn:
+        candidates = conn.exec_driver_sql(
+            "SELECT r.session_id, count(*) FROM response r JOIN session s ON s.id = r.session_id "
+            "WHERE s.created_at < ? AND r.session_id != (SELECT session_id FROM response ORDER BY id DESC LIMIT 1) "
+            "GROUP BY r.session_id ORDER BY r.session_id", (before.strftime('%Y-%m-%d %H:%M:%S'),)).fetchall()
+    archived = written = 0
+    start = 0
+    while start < len(candidates):
+        end, rows = start, 0
+        while end < len(candidates) and (rows == 0 or rows + candidates[end][1] <= segment_rows):
+            rows += candidates[end][1]
+            end += 1
+        batch = [sid for sid, _ in candidates[start:end]]
+        start = end
+        with db.engine.connect() as conn:
+            fetched = conn.connection.cursor().execute(
+                "SELECT id, session_id, question_id, correct, difficulty, time_taken, subject FROM response "
+                "WHERE session_id BETWEEN ? AND ? ORDER BY session_id, id", (batch[0], batch[-1])).fetchall()
+        wanted = set(batch)
+        fetched = [r for r in fetched if r[1] in wanted]
+        if not fetched:
+            continue
+        subjects = sorted({r[6] for r in fetched}, key=lambda v: (v is None, v or ''))
+        code = {subj: k for k, subj in enumerate(subjects)}
+        ids, sids, qids, correct, diffs, times, subj = zip(*fetched)
+        table = {'id': np.array(ids), 'session_id': np.array(sids),
+                 'question_id': np.array([q or 0 for q in qids]), 'correct': np.array([bool(c) for c in correct]),
+                 'difficulty': np.array([d or 0 for d in diffs]),
+                 'time_taken': np.array([np.nan if t is None else t for t in times], dtype=float),
+                 'subject': np.array([code[s] for s in subj])}
+        seg_path = os.path.join(path, f"seg-{number:06d}")
+        _write_segment(seg_path, table, subjects)
+        _commit_segment(ArchiveSegment(seg_path, number))
+        archived += len(fetched)
+        written += 1
+        number += 1
+    return archived, written
+
+def _commit_segment(seg):
+    """Drop the segment's rows from SQLite and make the segment visible, atomically."""
+    c = seg.columns
+    sessions = np.unique(c['session_id']).tolist()
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM response WHERE session_id = :sid AND id <= :max_id"),
+                     [{'sid': sid, 'max_id': seg.meta['max_id']} for sid in sessions])
+        conn.execute(sqlite_insert(JobState).values(name=ARCHIVE_STATE, value=seg.number).on_conflict_do_update(
+            index_elements=['name'], set_={'value': seg.number}))
+
+@bp.cli.command('archive')
+@click.option('--older-than', default=24.0, show_default=True, help="Hours since a session started before it counts as closed.")
+@click.option('--segment-rows', default=500000, show_default=True)
+@click.option('--vacuum', is_flag=True, help="VACUUM afterwards to give the freed pages back to the filesystem.")
+def archive_command(older_than, segment_rows, vacuum):
+    """Move closed sessions' responses from SQLite into memory-mapped column segments."""
+    migrate_db()
+    started = time.time()
+    before = datetime.now(timezone.utc) - timedelta(hours=older_than)   # created_at is stored in UTC
+    archived, written = archive_responses(before, segment_rows)
+    if vacuum and archived:
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+    click.echo(f"Archived {archived} responses into {written} segments in {time.time() - started:.1f}s.")
+
+# ---------------- Item Calibration ----------------
+def session_abilities(conn):
+    """
+    PROX ability estimate per session from its aggregates (mean item difficulty
+    on the ability scale plus the logit of its accuracy), as a dense array
+    indexed by session id.
+    """
+    rows = np.array(conn.connection.cursor().execute(
+        "SELECT session_id, attempts, correct, total_difficulty FROM session_stats WHERE attempts > 0").fetchall(),
+        dtype=float).reshape(-1, 4)
+    theta = np.zeros(int(rows[:, 0].max()) + 1 if len(rows) else 1)
+    n, c = rows[:, 1], rows[:, 2]
+    theta[rows[:, 0].astype(np.int64)] = rows[:, 3] / n - 3.0 + np.log((c + 0.5) / (n - c + 0.5))
+    return theta
+
+def calibrate_items(chunk_size=200000, full=False, min_responses=20):
+    """
+    Re-estimate item statistics from the response log, archived segments
+    included. Responses are read in chunks, folded into per-item sums with np.bincount and added to the
+    sums kept in item_calibration, so an incremental run only reads responses
+    newer than the last one. For each touched item this writes the p-value,
+    mean time and, once it has min_responses answers, a PROX difficulty
+    irt_b = mean respondent ability + logit(P(wrong)). Adaptive delivery matches
+    items to students, so the ability adjustment is what keeps hard items from
+    looking easy. Returns (responses read, items updated).
+
+    The scan only reads, so live answers keep committing while it runs; the
+    write lock is taken for the short final step alone.
+    """
+    if np is None:
+        raise RuntimeError("calibration needs numpy installed")
+    with db.engine.connect() as conn:
+        last = 0 if full else \
+            conn.exec_driver_sql("SELECT value FROM job_state WHERE name = 'calibration'").scalar() or 0
+        theta = session_abilities(conn)
+        cur = conn.connection.cursor()   # plain DB-API tuples convert to NumPy far faster than Row objects
+        size = (conn.exec_driver_sql("SELECT max(id) FROM question").scalar() or 0) + 1
+        sums = np.zeros((4, size))   # responses, correct, time, ability
+
+        def fold(sid, qid, correct, time_taken):
+            keep = (qid > 0) & (qid < size)      # responses to deleted questions are dropped
+            sid, qid = sid[keep], qid[keep]
+            ability = np.where(sid < len(theta), theta[np.minimum(sid, len(theta) - 1)], 0.0)
+            sums[0] += np.bincount(qid, minlength=size)
+            sums[1] += np.bincount(qid, weights=np.nan_to_num(correct[keep]), minlength=size)
+            sums[2] += np.bincount(qid, weights=np.nan_to_num(time_taken[keep]), minlength=size)
+            sums[3] += np.bincount(qid, weights=ability, minlength=size)
+
+        # archived responses first, straight from the mapped columns
+        read, newest = 0, last
+        for seg in response_archive.segments(refresh=True):
+            if seg.meta['max_id'] <= last:
+                continue
+            c = seg.columns
+            for lo in range(0, seg.meta['rows'], chunk_size):
+                hi = lo + chunk_size
+                new = c['id'][lo:hi] > last
+                fold(c['session_id'][lo:hi][new], c['question_id'][lo:hi][new],
+                     c['correct'][lo:hi][new].astype(float), c['time_taken'][lo:hi][new])
+                read += int(new.sum())
+            newest = max(newest, seg.meta['max_id'])
+        while True:
+            rows = cur.execute(
+                "SELECT id, session_id, question_id, correct, time_taken FROM response WHERE id > ? ORDER BY id LIMIT ?",
+                (last, chunk_size)).fetchall()
+            if not rows:
+                break
+            chunk = np.array(rows, dtype=float)   # NULL -> nan
+            last = int(chunk[-1, 0])
+            read += len(chunk)
+            fold(chunk[:, 1].astype(np.int64), chunk[:, 2].astype(np.int64), chunk[:, 3], chunk[:, 4])
+    last = max(last, newest)
+    touched = np.nonzero(sums[0])[0]
+    updated = 0
+    with db.engine.begin() as conn:
+        # write first, so the lock is held before item_calibration is read back below
+        conn.execute(sqlite_insert(JobState).values(name='calibration', value=last).on_conflict_do_update(
+            index_elements=['name'], set_={'value': last}))
+        if full:
+            conn.exec_driver_sql("DELETE FROM item_calibration")
+        elif len(touched):
+            prev = np.array(conn.connection.cursor().execute(
+                "SELECT question_id, responses, correct, total_time, total_ability FROM item_calibration").fetchall(),
+                dtype=float).reshape(-1, 5)
+            prev = prev[prev[:, 0] < size]
+            sums[:, prev[:, 0].astype(np.int64)] += prev[:, 1:].T
+        if len(touched):
+            n, c, t, a = sums[:, touched]
+            p_value = c / n
+            irt_b = a / n + np.log((n - c + 0.5) / (c + 0.5))
+            upsert = sqlite_insert(ItemCalibration)
+            upsert = upsert.on_conflict_do_update(index_elements=['question_id'], set_={col: upsert.excluded[col] for col in (
+                'responses', 'correct', 'total_time', 'total_ability', 'p_value', 'mean_time')})
+            conn.execute(upsert, [
+                {'question_id': q, 'responses': int(nn), 'correct': int(cc), 'total_time': tt, 'total_ability': aa,
+                 'p_value': pv, 'mean_time': tt / nn}
+                for q, nn, cc, tt, aa, pv in zip(touched.tolist(), n.tolist(), c.tolist(), t.tolist(), a.tolist(),
+                                                 p_value.tolist())])
+            enough = n >= min_responses
+            updated = int(enough.sum())
+            if updated:
+                conn.execute(text("UPDATE question SET irt_b = :b WHERE id = :id"),
+                             [{'id': q, 'b': b} for q, b in zip(touched[enough].tolist(), irt_b[enough].tolist())])
+    question_bank.invalidate()
+    return read, updated
+
+@bp.cli.command('calibrate')
+@click.option('--full', is_flag=True, help="Recompute from the whole response log instead of new responses only.")
+@click.option('--chunk-size', default=200000, show_default=True)
+@click.option('--min-responses', default=20, show_default=True, help="Answers needed before irt_b is rewritten.")
+def calibrate_command(full, chunk_size, min_responses):
+    """Re-estimate item p-value, mean time and IRT difficulty from the response log."""
+    migrate_db()
+    started = time.time()
+    read, updated = calibrate_items(chunk_size, full, min_responses)
+    click.echo(f"Read {read} responses, recalibrated {updated} items in {time.time() - started:.1f}s.")
+
+# ---------------- Live Dashboard (SSE) ----------------
+class AnalyticsHub:
+    """
+    Fan-out of /teacher/analytics row deltas to Server-Sent Events subscribers.
+    Writers only mark session ids dirty; one broadcaster thread turns the dirty set
+    into rows every SSE_INTERVAL seconds with a single page query and puts the same
+    encoded event on every subscriber queue, so N dashboards cost one computation.
+    Marking is a no-op while nobody is subscribed. With MULTI_PROCESS the writes
+    of other workers never mark this one, so the broadcaster also polls the
+    database each interval for sessions created or answered since its last look.
+    """
+    QUEUE_SIZE = 256   # events buffered per subscriber before it is dropped (it reconnects)
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._dirty = set()
+        self._subscribers = set()
+        self._thread = None
+        self._seen = None   # (max response id, max session id) at the last poll
+
+    def mark(self, session_id):
+        if not self._subscribers:
+            return
+        with self._cond:
+            self._dirty.add(session_id)
+            self._cond.notify()
+
+    def subscribe(self):
+        q = queue.Queue(self.QUEUE_SIZE)
+        with self._cond:
+            self._subscribers.add(q)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(current_app._get_current_object(),),
+                                                name='analytics-hub', daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self._cond:
+            self._subscribers.discard(q)
+
+    def _changed_sessions(self):
+        """Sessions any process started or answered since the last poll; two max(rowid) reads when idle."""
+        top = (db.session.execute(select(func.max(Response.id))).scalar() or 0,
+               db.session.execute(select(func.max(Session.id))).scalar() or 0)
+        seen, self._seen = self._seen, top
+        if seen is None or seen == top:
+            return set()
+        ids = set(db.session.execute(select(Response.session_id).where(Response.id > seen[0]).distinct()).scalars())
+        ids.update(range(seen[1] + 1, top[1] + 1))
+        return ids
+
+    def _run(self, app):
+        poll = app.config['MULTI_PROCESS']
+        while True:
+            with self._cond:
+                while not self._dirty and not poll:
+                    self._cond.wait()
+            time.sleep(app.config['SSE_INTERVAL'])   # let a burst of answers coalesce
+            with self._cond:
+                ids, self._dirty = self._dirty, set()
+                subscribers = list(self._subscribers)
+            if not subscribers:
+                self._seen = None   # start afresh from the next subscriber's first poll
+                continue
+            try:
+                with app.app_context():
+                    response_writer.flush()
+                    if poll:
+                        ids |= self._changed_sessions()
+                    if not ids:
+                        continue
+                    pairs = db.session.query(Session, SessionStats)\
+                        .outerjoin(SessionStats, SessionStats.session_id == Session.id)\
+                        .filter(Session.id.in_(ids)).order_by(Session.id).all()
+                    event_ = f"event: rows\ndata: {json.dumps(analytics_rows(pairs))}\n\n".encode()
+            except Exception:
+                app.logger.exception("dashboard update failed")
+                continue
+            for q in subscribers:
+                try:
+                    q.put_nowait(event_)
+                except queue.Full:
+                    # too far behind: drop its backlog and end the stream; EventSource reconnects
+                    self.unsubscribe(q)
+                    while not q.empty():
+                        try:
+                            q.get_nowait()
+                        except queue.Empty:
+                            break
+                    q.put_nowait(None)
+
+analytics_hub = _per_app('analytics_hub')
+
+@bp.route('/teacher/stream')
+def teacher_stream():
+    """SSE stream of changed /teacher/analytics rows ('rows' events, a JSON array each)."""
+    q = analytics_hub.subscribe()
+    keepalive = current_app.config['SSE_KEEPALIVE']
+
+    def events():
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    event_ = q.get(timeout=keepalive)
+                except queue.Empty:
+                    event_ = b": keepalive\n\n"
+                if event_ is None:   # fell too far behind; the browser reconnects and refetches
+                    return
+                yield event_
+        finally:
+            analytics_hub.unsubscribe(q)
+
+    return current_app.response_class(events(), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# ---------------- Export ----------------
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+def export_query(kind, since=None, until=None, session_id=None, after_id=None):
+    """
+    SELECT for /export/<kind>, in id order. since/until filter on the session's
+    created_at; after_id (response or session id) lets a nightly job resume from
+    the largest id it has seen. Archived responses are not in SQLite and come
+    from export_archived() instead.
+    """
+    if kind == 'responses':
+        q = select(Response.id, Response.session_id, Response.question_id, Response.correct,
+                   Response.difficulty, Response.time_taken, Response.subject)
+        if since or until:
+            q = q.join(Session, Session.id == Response.session_id)
+        id_col, sid_col = Response.id, Response.session_id
+    elif kind == 'sessions':
+        q = select(Session.id, Session.student, Session.roll_no, Session.created_at,
+                   func.coalesce(SessionStats.attempts, 0).label('attempts'),
+                   func.coalesce(SessionStats.correct, 0).label('correct'),
+                   func.coalesce(SessionStats.total_time, 0.0).label('total_time'),
+                   func.coalesce(SessionStats.total_difficulty, 0).label('total_difficulty'))\
+            .outerjoin(SessionStats, SessionStats.session_id == Session.id)
+        id_col, sid_col = Session.id, Session.id
+    else:
+        raise ValueError(f"unknown export {kind!r}")
+    if since:
+        q = q.where(Session.created_at >= datetime.fromisoformat(since))
+    if until:
+        q = q.where(Session.created_at < datetime.fromisoformat(until))
+    if session_id:
+        q = q.where(sid_col == int(session_id))
+    if after_id:
+        q = q.where(id_col > int(after_id))
+    return q.order_by(id_col)
+
+def export_archived(since=None, until=None, session_id=None, after_id=None, batch=2000):
+    """Batches of archived response rows for /export/responses, with export_query()'s filters."""
+    if np is None:
+        return
+    sessions = None
+    if since or until:
+        q = select(Session.id)
+        if since:
+            q = q.where(Session.created_at >= datetime.fromisoformat(since))
+        if until:
+            q = q.where(Session.created_at < datetime.fromisoformat(until))
+        sessions = np.array(db.session.execute(q).scalars().all(), dtype=np.int64)
+    for seg in response_archive.segments(refresh=True):
+        if after_id and seg.meta['max_id'] <= int(after_id):
+            continue
+        c = seg.columns
+        lo, hi = 0, seg.meta['rows']
+        if session_id:
+            lo, hi = np.searchsorted(c['session_id'], [int(session_id), int(session_id) + 1])
+        for start in range(lo, hi, batch):
+            end = min(start + batch, hi)
+            keep = np.ones(end - start, dtype=bool)
+            if after_id:
+                keep &= c['id'][start:end] > int(after_id)
+            if sessions is not None:
+                keep &= np.isin(c['session_id'][start:end], sessions)
+            rows = [row for row, k in zip(seg.rows(start, end), keep.tolist()) if k]
+            if rows:
+                yield rows
+
+def export_chunks(query, fmt, compress=False, batch=2000, archived=()):
+    """
+    Encode rows as CSV or NDJSON bytes, batch by batch, optionally gzip'd; memory
+    stays flat. Batches from archived (see export_archived) go out first.
+    """
+    result = db.session.execute(query.execution_options(yield_per=batch))
+    columns = list(result.keys())
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def encode(rows, header=False):
+        buf = io.StringIO()
+        if fmt == 'csv':
+            writer = csv.writer(buf)
+            if header:
+                writer.writerow(columns)
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                buf.write(json.dumps({c: (v.isoformat() if isinstance(v, datetime) else v)
+                                      for c, v in zip(columns, row)}))
+                buf.write("\n")
+        data = buf.getvalue().encode()
+        return gz.compress(data) if gz else data
+
+    chunk = encode([], header=True)
+    if chunk:
+        yield chunk
+    for rows in archived:
+        yield encode(rows)
+    for rows in result.partitions():
+        chunk = encode(rows)
+        if chunk:
+            yield chunk
+    if gz:
+        yield gz.flush()
+
+@bp.route('/export/<kind>')
+def export(kind):
+    """
+    Stream responses or sessions as CSV/NDJSON. Query params: format (csv|ndjson),
+    gzip=1, since/until (ISO dates, session created_at), session_id, after_id.
+    """
+    args = request.args
+    fmt = args.get('format', 'csv')
+    if kind not in ('responses', 'sessions') or fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'unknown export or format'}), 404
+    try:
+        query = export_query(kind, args.get('since'), args.get('until'), args.get('session_id'), args.get('after_id'))
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO dates, ids integers'}), 400
+    response_writer.flush()
+    archived = export_archived(args.get('since'), args.get('until'), args.get('session_id'), args.get('after_id')) \
+        if kind == 'responses' else ()
+    compress = args.get('gzip') in ('1', 'true')
+    filename = f"{kind}.{fmt}" + (".gz" if compress else "")
+    resp = current_app.response_class(stream_with_context(export_chunks(query, fmt, compress, archived=archived)),
+                              mimetype='application/gzip' if compress else EXPORT_FORMATS[fmt])
+    resp.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return resp
+
+@bp.cli.command('export')
+@click.argument('kind', type=click.Choice(['responses', 'sessions']))
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True)
+@click.option('--since', help="ISO date, on session created_at.")
+@click.option('--until', help="ISO date, exclusive.")
+@click.option('--session-id', type=int)
+@click.option('--after-id', type=int, help="Only rows with a larger id (resume a previous export).")
+@click.option('-o', '--output', type=click.File('wb'), default='-', help="Defaults to stdout.")
+def export_command(kind, fmt, compress, since, until, session_id, after_id, output):
+    """Stream responses or sessions as CSV/NDJSON."""
+    archived = export_archived(since, until, session_id, after_id) if kind == 'responses' else ()
+    for chunk in export_chunks(export_query(kind, since, until, session_id, after_id), fmt, compress, archived=archived):
+        output.write(chunk)
+
+# ---------------- Instrumentation ----------------
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'total', 'n')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.n += 1
+
+    def lines(self, name, labels):
+        out, running = [], 0
+        for bound, count in zip(self.bounds, self.counts):
+            running += count
+            out.append(f'{name}_bucket{{{labels},le="{bound}"}} {running}')
+        out.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.n}')
+        out.append(f'{name}_sum{{{labels}}} {self.total}')
+        out.append(f'{name}_count{{{labels}}} {self.n}')
+        return out
+
+class Metrics:
+    """
+    Per-route latency and SQL histograms for /metrics (Prometheus text format).
+    SQL statements are counted through engine cursor events, which are only
+    installed the first time a request runs with METRICS_ENABLED, so a disabled
+    deployment pays one config lookup per request and nothing per query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}    # (route, method, status) -> count
+        self.latency = {}     # route -> Histogram (seconds)
+        self.queries = {}     # route -> Histogram (statements per request)
+        self.db_time = {}     # route -> Histogram (seconds in SQL per request)
+        self.profiled = 0
+        self._installed = False
+
+    def install(self):
+        with self._lock:
+            if self._installed:
+                return
+            event.listen(Engine, 'before_cursor_execute', _sql_started)
+            event.listen(Engine, 'after_cursor_execute', _sql_finished)
+            self._installed = True
+
+    def observe(self, route, method, status, elapsed, queries, db_time):
+        with self._lock:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault(route, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.queries.setdefault(route, Histogram(QUERY_BUCKETS)).observe(queries)
+            self.db_time.setdefault(route, Histogram(LATENCY_BUCKETS)).observe(db_time)
+
+    def render(self):
+        out = ['# TYPE assessment_requests_total counter']
+        with self._lock:
+            for (route, method, status), n in sorted(self.requests.items()):
+                out.append(f'assessment_requests_total{{route="{route}",method="{method}",status="{status}"}} {n}')
+            for name, table, help_ in (
+                    ('assessment_request_seconds', self.latency, 'request latency'),
+                    ('assessment_request_sql_queries', self.queries, 'SQL statements per request'),
+                    ('assessment_request_sql_seconds', self.db_time, 'time spent in SQL per request')):
+                out.append(f'# HELP {name} {help_}')
+                out.append(f'# TYPE {name} histogram')
+                for route, hist in sorted(table.items()):
+                    out.extend(hist.lines(name, f'route="{route}"'))
+            out.append('# TYPE assessment_profiled_slow_requests_total counter')
+            out.append(f'assessment_profiled_slow_requests_total {self.profiled}')
+        out.append('# TYPE assessment_session_states gauge')
+        out.append(f'assessment_session_states {len(session_states._states)}')
+        out.append('# TYPE assessment_question_bank_size gauge')
+        out.append(f'assessment_question_bank_size {len(question_bank._slots)}')
+        out.append('# TYPE assessment_write_behind_pending gauge')
+        out.append(f'assessment_write_behind_pending {len(response_writer._pending)}')
+        return "\n".join(out) + "\n"
+
+metrics = Metrics()
+
+def _sql_started(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_started' in g:
+        conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+def _sql_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_query_started')
+    if started and has_request_context() and 'metrics_started' in g:
+        g.metrics_sql_time += time.perf_counter() - started.pop()
+        g.metrics_sql_count += 1
+
+# one profiled request at a time: from Python 3.12 a second active cProfile raises ValueError
+_profile_lock = threading.Lock()
+
+@bp.before_app_request
+def _metrics_before():
+    if not current_app.config['METRICS_ENABLED']:
+        return
+    metrics.install()
+    g.metrics_sql_count = 0
+    g.metrics_sql_time = 0.0
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    if rate and random.random() < rate and _profile_lock.acquire(blocking=False):
+        g.metrics_profiler = cProfile.Profile()
+        try:
+            g.metrics_profiler.enable()
+        except ValueError:   # a profiler outside this app (e.g. a profiling debugger) is active
+            del g.metrics_profiler
+            _profile_lock.release()
+    g.metrics_started = time.perf_counter()
+
+@bp.after_app_request
+def _metrics_after(response):
+    if 'metrics_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.metrics_started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    profiler = g.pop('metrics_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+        if elapsed >= current_app.config['PROFILE_SLOW_SECONDS']:
+            buf = io.StringIO()
+            pstats.Stats(profiler, stream=buf).sort_stats('cumulative').print_stats(25)
+            metrics.profiled += 1
+            current_app.logger.warning("slow request %s %s took %.3fs (%d SQL statements)\n%s",
+                               request.method, request.path, elapsed, g.metrics_sql_count, buf.getvalue())
+    metrics.observe(route, request.method, response.status_code, elapsed, g.metrics_sql_count, g.metrics_sql_time)
+    return response
+
+@bp.teardown_app_request
+def _metrics_teardown(exc):
+    profiler = g.pop('metrics_profiler', None)
+    if profiler is not None:   # _metrics_after did not run
+        profiler.disable()
+        _profile_lock.release()
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    if not current_app.config['METRICS_ENABLED']:
+        return jsonify({'error': 'metrics disabled'}), 404
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# ---------------- Multi-Process Serving ----------------
+# Each worker keeps its own question index and session states. Question changes
+# reach other workers through the trigger-maintained counter (QuestionBank.sync);
+# session states are revalidated against SessionStats when MULTI_PROCESS is set.
+@bp.before_app_request
+def _sync_caches():
+    question_bank.sync()
+
+def _reset_after_fork():
+    """
+    Child of a pre-forking server (gunicorn --preload, bench --workers): pooled
+    connections, locks, background threads and caches inherited from the parent
+    are not usable here, so start them afresh.
+    """
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)   # leave the parent's sockets alone
+        app.extensions['assessment'] = _new_app_state()
+    installed = metrics._installed   # Engine listeners are already registered
+    metrics.__init__()
+    metrics._installed = installed
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 # ---------------- API ----------------
-@app.route('/_ping')
+@bp.route('/_ping')
 def ping(): 
     return jsonify({'ok': True})
 
-@app.route('/start_session', methods=['POST'])
+@bp.route('/start_session', methods=['POST'])
 def start_session():
     data = request.json or {}
+    if data.get('token'):
+        return start_provisioned_session(str(data['token']))
     student = data.get('student','Anonymous')
     roll_no = data.get('roll_no','-')
     s = Session(student=student, roll_no=roll_no)
     db.session.add(s)
     db.session.commit()
+    session_states.create(s.id)
+    analytics_hub.mark(s.id)
     return jsonify({'session_id': s.id, 'next_difficulty': 2})
 
-@app.route('/next_question', methods=['POST'])
+def start_provisioned_session(token):
+    """
+    Start of a session pre-created by /sessions/bulk: an indexed read, no write.
+    The preselected first question comes back inline until the session has answers.
+    """
+    row = db.session.execute(select(Session.id, Session.student, Session.roll_no, Session.first_question_id)
+                             .where(Session.token == token)).first()
+    if row is None:
+        return jsonify({'error': 'unknown token'}), 404
+    state = session_states.get(row.id)
+    head = json.dumps({'session_id': row.id, 'student': row.student, 'roll_no': row.roll_no, 'next_difficulty': 2},
+                      separators=(',', ':'))
+    if state.attempts or not row.first_question_id or question_bank.difficulty(row.first_question_id) is None:
+        return json_bytes_response(head.encode())
+    return json_bytes_response(head[:-1].encode() + b',"question":' + question_bank.payload(row.first_question_id) + b'}')
+
+@bp.route('/sessions/bulk', methods=['POST'])
+def sessions_bulk():
+    """
+    Pre-create sessions for a roster ({"roster": [{"student", "roll_no"}, ...]})
+    in one transaction ahead of an exam, each with a start token and its first
+    question already chosen at difficulty 2. Students then start with
+    /start_session {"token"}, which only reads.
+    """
+    roster = (request.json or {}).get('roster') or []
+    if not isinstance(roster, list) or len(roster) > current_app.config['BULK_ROSTER_MAX'] \
+            or not all(isinstance(r, dict) for r in roster):
+        return jsonify({'error': f"roster must be a list of at most {current_app.config['BULK_ROSTER_MAX']} "
+                                 "{student, roll_no} objects"}), 400
+    question_bank.ensure_loaded()
+    rows = [{'student': str(r.get('student') or 'Anonymous'), 'roll_no': str(r.get('roll_no') or '-'),
+             'token': secrets.token_urlsafe(12), 'first_question_id': pick_question_id(2)} for r in roster]
+    ids = db.session.execute(insert(Session).returning(Session.id, sort_by_parameter_order=True), rows).scalars().all() \
+        if rows else []
+    db.session.commit()
+    for sid in ids:
+        session_states.create(sid)
+        analytics_hub.mark(sid)
+    return jsonify([{'session_id': sid, 'student': r['student'], 'roll_no': r['roll_no'], 'token': r['token']}
+                    for sid, r in zip(ids, rows)])
+
+def question_payload(q):
+    return {'id': q.id, 'text': q.text, 'options': q.options, 'difficulty': q.difficulty, 'subject': q.subject}
+
+def json_bytes_response(body):
+    return current_app.response_class(body, mimetype='application/json')
+
+def grade(q, selected):
+    if q and q.answer:
+        try:
+            return selected.strip().lower() == str(q.answer).strip().lower()
+        except Exception:
+            return False
+    return False
+
+def parse_time_taken(value):
+    """Seconds spent on an answer; NaN, infinities and negatives would poison the session aggregates."""
+    seconds = float(value)
+    if not math.isfinite(seconds) or seconds < 0:
+        raise ValueError("time_taken must be a finite, non-negative number of seconds")
+    return seconds
+
+def grade_and_record(data):
+    """
+    Grade one answer, record its Response and aggregates, commit, then update the
+    session's adaptive state. Returns (correct, next_difficulty, state); raises
+    KeyError, TypeError or ValueError on a malformed answer.
+    """
+    session_id = int(data['session_id'])
+    qid = int(data['question_id'])
+    selected = str(data.get('selected','')).strip()
+    time_taken = parse_time_taken(data.get('time_taken', 0.0))
+    q = db.session.get(Question, qid)
+    if q is None:
+        raise ValueError(f"unknown question {qid}")
+    correct = grade(q, selected)
+    state = session_states.get(session_id)   # loaded before the insert so a cold rebuild excludes it
+    row = dict(session_id=session_id, question_id=qid, correct=correct, difficulty=q.difficulty, time_taken=time_taken, subject=q.subject)
+    if current_app.config['WRITE_BEHIND']:
+        state.record(qid, correct, q.difficulty, time_taken)
+        next_diff = adaptive_engine().after_answer(state, q, correct)
+        response_writer.submit(row)
+    else:
+        db.session.add(Response(**row))
+        bump_session_stats([row])
+        db.session.commit()
+        state.record(qid, correct, q.difficulty, time_taken)
+        next_diff = adaptive_engine().after_answer(state, q, correct)
+    analytics_hub.mark(session_id)
+    return correct, next_diff, state
+
+@bp.route('/next_question', methods=['POST'])
 def next_question():
     data = request.json or {}
     target_diff = int(data.get('difficulty',3))
     session_id = data.get('session_id')
-    used_q_ids = [r.question_id for r in Response.query.filter_by(session_id=session_id).all()] if session_id else []
-    q = Question.query.filter(
-        Question.difficulty.between(max(1,target_diff-1), min(5,target_diff+1))
-    ).filter(~Question.id.in_(used_q_ids)).order_by(func.random()).first()
-    if not q:
-        q = Question.query.filter(~Question.id.in_(used_q_ids)).order_by(func.random()).first()
-    if not q:
-        q = Question.query.order_by(func.random()).first()
-    return jsonify({'id': q.id, 'text': q.text, 'options': eval(q.options), 'difficulty': q.difficulty, 'subject': q.subject})
-
-@app.route('/submit_answer', methods=['POST'])
+    if session_id:
+        qid = adaptive_engine().pick(session_states.get(int(session_id)), target_diff)
+    else:
+        qid = pick_question_id(target_diff)
+    return json_bytes_response(question_bank.payload(qid))
+
+@bp.route('/submit_answer', methods=['POST'])
 def submit_answer():
+    try:
+        correct, next_diff, state = grade_and_record(request.json or {})
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f"malformed answer: {e}"}), 400
+    return jsonify({'correct': correct, 'next_difficulty': next_diff, 'stats': state.stats()})
+
+@bp.route('/answer_and_next', methods=['POST'])
+def answer_and_next():
+    """submit_answer + next_question in one round trip, reusing the in-memory session state."""
+    try:
+        correct, next_diff, state = grade_and_record(request.json or {})
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f"malformed answer: {e}"}), 400
+    head = json.dumps({'correct': correct, 'next_difficulty': next_diff, 'stats': state.stats()}, separators=(',', ':'))
+    # splice the cached question bytes in rather than re-encoding them
+    return json_bytes_response(head[:-1].encode() + b',"question":' + question_bank.payload(adaptive_engine().pick(state, next_diff)) + b'}')
+
+# ---------------- Offline Test Packs ----------------
+def pack_key(salt, option):
+    """FNV-1a of salt + normalized option; the frontend computes the same in JS to branch offline."""
+    h = 0x811c9dc5
+    for byte in (salt + str(option).strip().lower()).encode():
+        h = ((h ^ byte) * 0x01000193) & 0xffffffff
+    return f"{h:08x}"
+
+def build_test_pack(state, start, depth):
+    """
+    Precompute the next `depth` steps of a session as a complete binary tree in
+    heap order: node i is answered wrong -> 2i+1, right -> 2i+2, and holds the
+    difficulty the +/-1 rolling-accuracy rule picks on that path. One question is
+    chosen per (level, difficulty) pair, all distinct and unused by the session,
+    so every path is repeat-free and the tree needs at most 5 * depth questions.
+    Returns (nodes as a digit string, {(level, difficulty): question id}).
+    """
+    question_bank.ensure_loaded()
+    nodes = bytearray(2 ** depth - 1)
+    nodes[0] = start
+    windows = {0: state.branch()}
+    chosen, table = set(state.used), {}
+    for level in range(depth):
+        first, last = 2 ** level - 1, 2 ** (level + 1) - 1
+        for d in sorted(set(nodes[first:last])):
+            qid = question_bank.sample(d, d, exclude=chosen) \
+                or question_bank.sample(max(1, d - 1), min(5, d + 1), exclude=chosen) \
+                or question_bank.sample(exclude=chosen) or question_bank.sample()
+            chosen.add(qid)
+            table[(level, d)] = qid
+        if level + 1 == depth:
+            break
+        for i in range(first, last):
+            # like submit_answer, the rule steps from the difficulty actually served
+            served = question_bank.difficulty(table[(level, nodes[i])]) or nodes[i]
+            window = windows.pop(i)
+            for correct in (False, True):
+                child = window.branch()
+                child.record(0, correct, 0, 0)
+                nodes[2 * i + 1 + correct] = child.next_difficulty(served)
+                windows[2 * i + 1 + correct] = child
+    return ''.join(map(str, nodes)), table
+
+@bp.route('/test_pack', methods=['POST'])
+def test_pack():
+    """
+    Offline test pack for a session: the adaptive tree of build_test_pack() with
+    the question payloads (index level * 5 + difficulty - 1, null where unused)
+    and salted answer keys, so the client can branch without a round trip and
+    upload everything with /submit_batch, where the server re-grades. The keys
+    only hide answers from casual inspection; grading is never taken from the client.
+    """
     data = request.json or {}
-    session_id = data['session_id']
-    qid = int(data['question_id'])
-    selected = str(data.get('selected','')).strip()
-    time_taken = float(data.get('time_taken', 0.0))
-    q = Question.query.get(qid)
-    correct = False
-    if q and q.answer:
-        try:
-            correct = (selected.strip().lower() == str(q.answer).strip().lower())
-        except Exception:
-            correct = False
-    r = Response(session_id=session_id, question_id=qid, correct=correct, difficulty=q.difficulty, time_taken=time_taken, subject=q.subject)
-    db.session.add(r)
-    db.session.commit()
-    recent = Response.query.filter_by(session_id=session_id).order_by(Response.id.desc()).limit(7).all()
-    acc = sum(1 for x in recent if x.correct)/len(recent) if recent else (1.0 if correct else 0.0)
-    current = q.difficulty
-    if acc >= 0.85:
-        next_diff = min(5, current + 1)
-    elif acc >= 0.6:
-        next_diff = current
-    else:
-        next_diff = max(1, current - 1)
-    return jsonify({'correct': correct, 'next_difficulty': next_diff})
+    session_id = int(data.get('session_id') or 0)
+    if db.session.get(Session, session_id) is None:
+        return jsonify({'error': 'unknown session'}), 404
+    depth = max(1, min(int(data.get('depth') or current_app.config['TEST_PACK_DEPTH']),
+                       current_app.config['TEST_PACK_MAX_DEPTH']))
+    start = max(1, min(5, int(data.get('difficulty', 2))))
+    nodes, table = build_test_pack(session_states.get(session_id), start, depth)
+    answers = dict(db.session.query(Question.id, Question.answer).filter(Question.id.in_(set(table.values()))))
+    salt = os.urandom(4).hex()
+    slots = [table.get((level, d)) for level in range(depth) for d in range(1, 6)]
+    head = json.dumps({'session_id': session_id, 'depth': depth, 'salt': salt, 'nodes': nodes,
+                       'keys': [pack_key(salt, answers.get(q, '')) if q else None for q in slots]},
+                      separators=(',', ':'))
+    questions = b','.join(question_bank.payload(q) if q else b'null' for q in slots)
+    return json_bytes_response(head[:-1].encode() + b',"questions":[' + questions + b']}')
+
+@bp.route('/submit_batch', methods=['POST'])
+def submit_batch():
+    """
+    Grade and record a run of answers (an offline test pack) in one transaction,
+    replaying them through the session's adaptive state in order, exactly as the
+    same answers sent one by one to /submit_answer would have been. A batch_id
+    makes retries idempotent: a batch already recorded returns its first result.
+    """
+    data = request.json or {}
+    answers = data.get('answers') or []
+    batch_id = data.get('batch_id')
+    if isinstance(answers, list) and len(answers) > current_app.config['TEST_PACK_MAX_DEPTH']:
+        return jsonify({'error': 'too many answers'}), 400   # one pack path, checked before parsing
+    if batch_id is not None and not (isinstance(batch_id, str) and 0 < len(batch_id) <= 64):
+        return jsonify({'error': 'batch_id must be a string of at most 64 characters'}), 400
+    try:
+        session_id = int(data.get('session_id') or 0)
+        next_diff = int(data.get('difficulty', 2))
+        if not isinstance(answers, list) or not all(isinstance(a, dict) for a in answers):
+            raise TypeError
+        qids = [int(a['question_id']) for a in answers]
+        times = [parse_time_taken(a.get('time_taken', 0.0)) for a in answers]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'answers must be a list of {question_id, selected, time_taken} objects'}), 400
+    if db.session.get(Session, session_id) is None:
+        return jsonify({'error': 'unknown session'}), 404
+    if batch_id is not None:
+        done = db.session.get(SubmittedBatch, (session_id, batch_id))
+        if done is not None:
+            return jsonify({**done.result, 'stats': session_states.get(session_id).stats()})
+    questions = {q.id: q for q in Question.query.filter(Question.id.in_(set(qids)))}
+    if any(qid not in questions for qid in qids):
+        return jsonify({'error': 'unknown question'}), 400
+    state = session_states.get(session_id)
+    response_writer.flush()   # keep this session's earlier queued answers ahead of the batch
+    engine = adaptive_engine()
+    rows, results = [], []
+    for a, qid, time_taken in zip(answers, qids, times):
+        q = questions[qid]
+        correct = grade(q, str(a.get('selected', '')))
+        rows.append(dict(session_id=session_id, question_id=q.id, correct=correct,
+                         difficulty=q.difficulty, time_taken=time_taken, subject=q.subject))
+        state.record(q.id, correct, q.difficulty, time_taken)
+        next_diff = engine.after_answer(state, q, correct)
+        results.append({'question_id': q.id, 'correct': correct, 'next_difficulty': next_diff})
+    result = {'results': results, 'next_difficulty': next_diff}
+    # the state is updated ahead of the commit (as with write-behind) and rebuilt if it fails
+    try:
+        if rows:
+            db.session.execute(Response.__table__.insert(), rows)
+            bump_session_stats(rows)
+        if batch_id is not None:
+            db.session.add(SubmittedBatch(session_id=session_id, batch_id=batch_id, result=result))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        session_states.discard(session_id)
+        done = db.session.get(SubmittedBatch, (session_id, batch_id)) if batch_id is not None else None
+        if done is None:
+            raise
+        # a concurrent retry of the same batch committed first
+        return jsonify({**done.result, 'stats': session_states.get(session_id).stats()})
+    except Exception:
+        db.session.rollback()
+        session_states.discard(session_id)
+        raise
+    analytics_hub.mark(session_id)
+    return jsonify({**result, 'stats': state.stats()})
 
-@app.route('/teacher/analytics')
+@bp.route('/session/<int:session_id>/stats')
+def session_stats(session_id):
+    """One session's analytics entry from its aggregate rows."""
+    response_writer.flush()
+    s = db.session.get(Session, session_id)
+    if s is None:
+        return jsonify({'error': 'unknown session'}), 404
+    st = db.session.get(SessionStats, session_id)
+    return jsonify(analytics_row(s, st, SubjectStats.query.filter_by(session_id=session_id).order_by(SubjectStats.id).all()))
+
+@bp.route('/teacher/analytics')
 def teacher_analytics():
-    sessions = Session.query.order_by(Session.created_at.desc()).all()
-    out = []
-    for s in sessions:
-        res = Response.query.filter_by(session_id=s.id).all()
-        attempts = len(res)
-        if attempts == 0:
-            avg_time = 0
-            accuracy = 0
-            avg_diff = 0
-            focus = []
-        else:
-            avg_time = sum(r.time_taken for r in res)/attempts
-            accuracy = sum(1 for r in res if r.correct)/attempts
-            avg_diff = sum(r.difficulty for r in res)/attempts
-            subj_stats = {}
-            for r in res:
-                subj_stats.setdefault(r.subject, {'total':0,'correct':0})
-                subj_stats[r.subject]['total'] += 1
-                if r.correct: subj_stats[r.subject]['correct'] += 1
-            focus = []
-            for subj, st in subj_stats.items():
-                acc = st['correct']/st['total'] if st['total']>0 else 0
-                if acc < 0.6:
-                    focus.append({'subject': subj, 'accuracy': round(acc,2), 'attempts': st['total']})
-        out.append({
-            'session_id': s.id,
-            'student': s.student,
-            'roll_no': s.roll_no,
-            'attempts': attempts,
-            'avg_time': round(avg_time,2),
-            'accuracy': round(accuracy,2),
-            'avg_difficulty': round(avg_diff,2),
-            'focus_areas': focus
-        })
-    return jsonify(out)
+    """
+    Newest sessions first, one page at a time. Query params: limit, cursor (from the
+    X-Next-Cursor header of the previous page), student, roll_no, since/until (ISO dates).
+    """
+    response_writer.flush()
+    args = request.args
+    limit = max(1, min(args.get('limit', current_app.config['ANALYTICS_PAGE_SIZE'], type=int), current_app.config['ANALYTICS_MAX_PAGE_SIZE']))
+    query = db.session.query(Session, SessionStats).outerjoin(SessionStats, SessionStats.session_id == Session.id)
+    if args.get('cursor'):
+        query = query.filter(Session.id < args.get('cursor', type=int))
+    if args.get('student'):
+        query = query.filter(Session.student == args['student'])
+    if args.get('roll_no'):
+        query = query.filter(Session.roll_no == args['roll_no'])
+    try:
+        if args.get('since'):
+            query = query.filter(Session.created_at >= datetime.fromisoformat(args['since']))
+        if args.get('until'):
+            query = query.filter(Session.created_at < datetime.fromisoformat(args['until']))
+    except ValueError:
+        return jsonify({'error': 'since/until must be ISO dates'}), 400
+    # ids grow with created_at, so id order is the stable equivalent of created_at desc
+    pairs = query.order_by(Session.id.desc()).limit(limit + 1).all()
+    resp = jsonify(analytics_rows(pairs[:limit]))
+    if len(pairs) > limit:
+        resp.headers['X-Next-Cursor'] = str(pairs[limit-1][0].id)
+    return resp
 
 # ---------------- Frontend (single-page improved UI) ----------------
 frontend_html = """(TRUNCATED FOR BREVITY: the full HTML/JS/CSS from prior message)"""
@@ -277,8 +2244,8 @@ frontend_html = """
 <head>
 <meta name="viewport" content="width=device-width,initial-scale=1">
 <title>Adaptive Assessment — Single File</title>
-<link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap" rel="stylesheet">
 <style>
+  /*FONT_FACE*/
   :root{
     --bg:#0f172a; --card:#0b1220; --muted:#94a3b8; --accent:#06b6d4; --success:#16a34a; --danger:#ef4444;
   }
@@ -338,7 +2305,7 @@ const totalQuestionsForProgress = 20; // progress bar scale (we seeded 70 but pr
 function fmt(n){ return Math.round(n*100)/100; }
 
 async function render(){
-  if(mode==='student') return renderStudent();
+  if(mode==='student'){ stopTeacherStream(); return renderStudent(); }
   return renderTeacher();
 }
 
@@ -358,6 +2325,7 @@ function studentFormHTML(){
         <label class="small">&nbsp;</label><br>
         <button onclick="startTest()">Start Test</button>
       </div>
+      <label class="small" title="Download questions in packs and upload answers in batches"><input id="offlineMode" type="checkbox" /> Low-bandwidth mode</label>
       <div style="margin-left:auto" class="small">Difficulty: <span id="curDiff">2</span></div>
     </div>
   </div>
@@ -430,14 +2398,100 @@ function stopTimer(){
 }
 
 async function startTest(){
+  // links handed out from /sessions/bulk carry ?token=..., which starts the pre-created session
+  const token = new URLSearchParams(location.search).get('token');
   const name = document.getElementById('studentName').value.trim() || 'Anonymous';
   const roll = document.getElementById('rollNo').value.trim() || '-';
-  const res = await fetch('/start_session', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({student:name, roll_no:roll})});
+  const res = await fetch('/start_session', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify(token ? {token} : {student:name, roll_no:roll})});
   const data = await res.json();
-  session = {session_id:data.session_id, student:name, roll_no:roll};
+  if(!res.ok){ alert(data.error || 'Could not start the session'); return; }
+  session = {session_id:data.session_id, student:data.student || name, roll_no:data.roll_no || roll};
   diff = data.next_difficulty || 2;
   qCount = 0;
-  await loadNext();
+  if(document.getElementById('offlineMode').checked) await loadPack();
+  else if(data.question){ question = data.question; qCount += 1; }
+  else await loadNext();
+  render();
+}
+
+// Low-bandwidth mode: /test_pack sends the next few steps of the adaptive tree,
+// answers branch locally and go up together through /submit_batch.
+let pack = null, packNode = 0, packLevel = 0, packAnswers = [];
+const UPLOAD_ATTEMPTS = 6;   // ~25s of backoff, then the batch waits in localStorage for the next upload
+const PENDING_PACKS = 'pendingPacks';
+
+function pendingPacks(){
+  try { return JSON.parse(localStorage.getItem(PENDING_PACKS)) || []; } catch(e){ return []; }
+}
+
+function savePendingPacks(list){
+  try { localStorage.setItem(PENDING_PACKS, JSON.stringify(list)); } catch(e){}
+}
+
+function packKey(salt, opt){
+  // FNV-1a, same as pack_key() on the server
+  let h = 0x811c9dc5;
+  for(const b of new TextEncoder().encode(salt + String(opt).trim().toLowerCase())) h = Math.imul(h ^ b, 0x01000193) >>> 0;
+  return h.toString(16).padStart(8, '0');
+}
+
+function packSlot(){ return packLevel*5 + Number(pack.nodes[packNode]) - 1; }
+
+async function loadPack(){
+  const res = await fetch('/test_pack', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({session_id:session.session_id, difficulty:diff})});
+  pack = await res.json();
+  packNode = 0; packLevel = 0;
+  question = pack.questions[packSlot()];
+  qCount += 1;
+}
+
+async function postBatch(body){
+  let res = null;
+  for(let attempt = 0; attempt < UPLOAD_ATTEMPTS; attempt++){
+    if(attempt) await new Promise(r => setTimeout(r, Math.min(8000, 500 * 2 ** attempt)));   // flaky link: keep the answers, retry
+    try { res = await fetch('/submit_batch', {method:'POST', headers:{'Content-Type':'application/json'}, body}); } catch(e){ res = null; }
+    if(res && res.status < 500) break;
+  }
+  return res;
+}
+
+async function uploadPack(){
+  if(packAnswers.length){
+    // queued before sending, so a dead link or a closed tab never loses a pack;
+    // batch_id lets the server ignore a copy it already recorded
+    savePendingPacks([...pendingPacks(), {session_id:session.session_id, difficulty:diff, batch_id:pack.salt, answers:packAnswers}]);
+    packAnswers = [];
+  }
+  await sendPendingPacks();
+}
+
+async function sendPendingPacks(){
+  for(let batch; (batch = pendingPacks()[0]);){
+    const res = await postBatch(JSON.stringify(batch));
+    if(!res || res.status >= 500) return;   // still offline: tried again on the next upload or page load
+    savePendingPacks(pendingPacks().filter(b => b.session_id !== batch.session_id || b.batch_id !== batch.batch_id));
+    if(!res.ok || !session || batch.session_id !== session.session_id) continue;
+    const r = await res.json();
+    diff = r.next_difficulty || diff;
+    session.stats = r.stats;
+  }
+}
+
+async function choosePackOption(opt, t){
+  const correct = packKey(pack.salt, opt) === pack.keys[packSlot()];
+  packAnswers.push({question_id:question.id, selected:opt, time_taken:Math.round(t*100)/100});
+  packNode = 2*packNode + (correct ? 2 : 1);
+  packLevel += 1;
+  if(packLevel < pack.depth){
+    diff = Number(pack.nodes[packNode]);
+    question = pack.questions[packSlot()];
+    qCount += 1;
+  } else {
+    question = null;
+    render();
+    await uploadPack();
+    await loadPack();
+  }
   render();
 }
 
@@ -451,8 +2505,9 @@ async function loadNext(){
 
 async function chooseOption(opt){
   const t = stopTimer();
+  if(pack) return choosePackOption(opt, t);
   const chosen = opt;
-  const res = await fetch('/submit_answer', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({
+  const res = await fetch('/answer_and_next', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({
     session_id: session.session_id,
     question_id: question.id,
     selected: chosen,
@@ -460,18 +2515,16 @@ async function chooseOption(opt){
   })});
   const r = await res.json();
   diff = r.next_difficulty || diff;
-  await updateSessionStats();
-  await loadNext();
+  if(r.stats) session.stats = r.stats;
+  else await updateSessionStats();
+  question = r.question;
+  qCount += 1;
   render();
 }
 
 async function updateSessionStats(){
-  const res = await fetch('/teacher/analytics');
-  const data = await res.json();
-  const me = data.find(d=>d.session_id===session.session_id);
-  if(me){
-    session.stats = me;
-  }
+  const res = await fetch(`/session/${session.session_id}/stats`);
+  if(res.ok) session.stats = await res.json();
 }
 
 function updateSessionStatsUI(){
@@ -482,6 +2535,7 @@ function updateSessionStatsUI(){
 }
 
 async function endSession(){
+  if(pack){ await uploadPack(); pack = null; }
   alert('Session ended. You can switch to Teacher Mode to see detailed analytics.');
   session = null;
   question = null;
@@ -489,41 +2543,188 @@ async function endSession(){
   render();
 }
 
+let teacherCursor = null;
+
+function teacherRowHTML(s){
+  let focus = '-';
+  if(s.focus_areas && s.focus_areas.length){
+    focus = s.focus_areas.map(f=>`${f.subject} (${Math.round(f.accuracy*100)}%)`).join('<br>');
+  }
+  return `<tr id="srow-${s.session_id}"><td>${escapeHtml(s.student)}</td><td>${escapeHtml(s.roll_no)}</td><td>${s.attempts}</td><td>${s.avg_time}</td><td>${Math.round(s.accuracy*100)}%</td><td>${s.avg_difficulty}</td><td>${focus}</td></tr>`;
+}
+
+async function fetchTeacherPage(cursor){
+  const res = await fetch('/teacher/analytics' + (cursor ? `?cursor=${cursor}` : ''));
+  teacherCursor = res.headers.get('X-Next-Cursor');
+  return res.json();
+}
+
 async function renderTeacher(){
-  const res = await fetch('/teacher/analytics');
-  const data = await res.json();
+  const data = await fetchTeacherPage(null);
   let html = `<div class="card"><h2>Teacher Dashboard</h2><div class="small">Overview of student sessions</div></div>`;
-  html += `<div class="card"><table><thead><tr><th>Student</th><th>Roll</th><th>Attempts</th><th>Avg Time (s)</th><th>Accuracy</th><th>Avg Diff</th><th>Focus Areas</th></tr></thead><tbody>`;
+  html += `<div class="card"><table><thead><tr><th>Student</th><th>Roll</th><th>Attempts</th><th>Avg Time (s)</th><th>Accuracy</th><th>Avg Diff</th><th>Focus Areas</th></tr></thead><tbody id="teacherRows">`;
   for(const s of data){
-    let focus = '-';
-    if(s.focus_areas && s.focus_areas.length){
-      focus = s.focus_areas.map(f=>`${f.subject} (${Math.round(f.accuracy*100)}%)`).join('<br>');
-    }
-    html += `<tr><td>${escapeHtml(s.student)}</td><td>${escapeHtml(s.roll_no)}</td><td>${s.attempts}</td><td>${s.avg_time}</td><td>${Math.round(s.accuracy*100)}%</td><td>${s.avg_difficulty}</td><td>${focus}</td></tr>`;
+    html += teacherRowHTML(s);
   }
-  html += `</tbody></table></div>`;
+  html += `</tbody></table><div style="margin-top:10px"><button id="moreRows" class="ghost" onclick="loadMoreTeacher()">Load more</button></div></div>`;
   html += `<div class="card"><h3>Notes</h3><div class="small">Focus Areas are subjects where student accuracy < 60%. Use this to plan targeted practice modules.</div></div>`;
   document.getElementById('main').innerHTML = html;
+  document.getElementById('moreRows').style.display = teacherCursor ? '' : 'none';
+  startTeacherStream();
+}
+
+let teacherStream = null;
+
+function startTeacherStream(){
+  if(teacherStream || !window.EventSource) return;
+  teacherStream = new EventSource('/teacher/stream');
+  teacherStream.addEventListener('rows', (e)=>{
+    const tbody = document.getElementById('teacherRows');
+    if(!tbody) return;
+    for(const s of JSON.parse(e.data)){
+      const row = document.getElementById(`srow-${s.session_id}`);
+      if(row) row.outerHTML = teacherRowHTML(s);
+      else tbody.insertAdjacentHTML('afterbegin', teacherRowHTML(s));
+    }
+  });
+}
+
+function stopTeacherStream(){
+  if(teacherStream){ teacherStream.close(); teacherStream = null; }
+}
+
+async function loadMoreTeacher(){
+  if(!teacherCursor) return;
+  const data = await fetchTeacherPage(teacherCursor);
+  document.getElementById('teacherRows').insertAdjacentHTML('beforeend', data.map(teacherRowHTML).join(''));
+  document.getElementById('moreRows').style.display = teacherCursor ? '' : 'none';
 }
 
 (async function init(){
   try { await fetch('/_ping'); } catch(e){}
   render();
+  sendPendingPacks();
 })();
 </script>
 </body>
 </html>
 """
 
-@app.route('/')
+# ---------------- Frontend delivery ----------------
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'fonts')
+
+class StaticAsset:
+    """
+    Bytes built once at startup and served from memory with a strong ETag and
+    precompressed gzip (and brotli, if installed) variants, picked by Accept-Encoding.
+    """
+    __slots__ = ('mimetype', 'etag', 'variants')
+
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        self.etag = hashlib.sha256(body).hexdigest()[:24]
+        self.variants = {'identity': body}
+        packed = {'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            packed['br'] = brotli.compress(body, quality=11)
+        for coding, data in packed.items():
+            if len(data) < len(body):   # woff2 and friends are already compressed
+                self.variants[coding] = data
+
+    def response(self, cache_control):
+        coding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in self.variants and request.accept_encodings[candidate]:
+                coding = candidate
+                break
+        # strong ETags are per representation, so each content-coding gets its own
+        etag = self.etag if coding == 'identity' else f"{self.etag}-{coding}"
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+        if request.if_none_match.contains(etag):
+            return current_app.response_class(status=304, headers=headers)
+        if coding != 'identity':
+            headers['Content-Encoding'] = coding
+        return current_app.response_class(self.variants[coding], mimetype=self.mimetype, headers=headers)
+
+def build_frontend():
+    """Self-hosted fonts from static/fonts/*.woff2 plus the page itself, with the font URLs fingerprinted."""
+    assets, faces = {}, []
+    for path in sorted(glob.glob(os.path.join(FONT_DIR, '*.woff2'))):
+        name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            assets[name] = StaticAsset(f.read(), 'font/woff2')
+        if name.lower().startswith('inter') and not faces:
+            faces.append(f"url('/assets/{name}?v={assets[name].etag}') format('woff2')")
+    # without a bundled file use an installed Inter, else the system-ui fallback in the stack
+    src = ','.join(["local('Inter')"] + faces)
+    face = ("@font-face{font-family:Inter;font-style:normal;font-weight:100 900;font-display:swap;"
+            f"src:{src}}}")
+    page = frontend_html.replace('/*FONT_FACE*/', face).encode()
+    return StaticAsset(page, 'text/html'), assets
+
+_frontend = None
+_frontend_lock = threading.Lock()
+
+def frontend_assets():
+    """(page, fonts) from build_frontend(), built on first use rather than at import."""
+    global _frontend
+    if _frontend is None:
+        with _frontend_lock:
+            if _frontend is None:
+                _frontend = build_frontend()
+    return _frontend
+
+@bp.route('/')
 def index():
-    return render_template_string(frontend_html)
+    # revalidate every load so a redeploy shows up at once; unchanged pages cost a 304
+    return frontend_assets()[0].response('no-cache')
+
+@bp.route('/assets/<name>')
+def asset(name):
+    a = frontend_assets()[1].get(name)
+    if a is None:
+        return jsonify({'error': 'not found'}), 404
+    return a.response(f"public, max-age={current_app.config['ASSET_MAX_AGE']}, immutable")
 
 # ---------------- Startup ----------------
+def _new_app_state():
+    """The caches and background workers one app owns; reached through the module-level proxies."""
+    return {'question_bank': QuestionBank(), 'session_states': SessionStateStore(),
+            'response_writer': ResponseWriter(), 'response_archive': ResponseArchive(),
+            'analytics_hub': AnalyticsHub()}
+
+def create_app(config=None, env_prefix=None):
+    """
+    Application factory: DefaultConfig updated with config, then with any
+    <env_prefix>_* environment variables (values parsed as JSON); both land before
+    the database engine is configured. Nothing connects or builds here; the schema
+    is checked on the first request, the page on the first page load, and seeding
+    is the explicit `flask seed` command. Each app gets its own question index,
+    session states and workers, so apps on different databases can share a process.
+    """
+    app = Flask(__name__)
+    app.config.from_object(DefaultConfig)
+    app.config.update(config or {})
+    if env_prefix:
+        app.config.from_prefixed_env(env_prefix)
+    if make_url(app.config['SQLALCHEMY_DATABASE_URI']).database not in (None, '', ':memory:'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**app.config['SQLALCHEMY_POOL_OPTIONS'],
+                                                   **app.config['SQLALCHEMY_ENGINE_OPTIONS']}
+    db.init_app(app)
+    app.register_blueprint(bp)
+    app.extensions['assessment'] = _new_app_state()
+    _apps.add(app)
+    return app
+
+@atexit.register
+def _close_writers():
+    """Commit every app's queued write-behind rows before the interpreter exits."""
+    for app in list(_apps):
+        app.extensions['assessment']['response_writer'].close()
+
 if __name__ == '__main__':
-    # If DB exists and is incompatible, recreate it (dev friendly)
-    ensure_db_schema()
+    app = create_app()
     with app.app_context():
-        db.create_all()
+        migrate_db()
         seed_questions()
     app.run(debug=True)
@@ -0,0 +1,321 @@
+# bench/loadtest.py  -- Reproducible load test for app.py
+"""
+Seeds a throwaway database, serves app.py from a child process and drives it with
+simulated students (start_session -> next_question -> submit_answer loop) and
+teachers polling /teacher/analytics. Prints (or writes) a JSON report with
+throughput and p50/p95/p99 latency per endpoint.
+
+    python bench/loadtest.py --questions 100000 --students 200 --out bench_output.json
+    python bench/loadtest.py --questions 100000 --students 200 --compare bench_output.json
+    python bench/loadtest.py --questions 100000 --students 200 --workers 4
+    python bench/loadtest.py --students 500 --rounds 1 --burst [--bulk]
+
+The report records every knob, so two reports are comparable only when their
+"config" blocks match; --compare warns when they do not.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BULK_CHUNK = 1000   # students per /sessions/bulk call
+
+
+# ---------------- Server (child process) ----------------
+def serve(args):
+    os.environ['ASSESSMENT_DB'] = args.db
+    sys.path.insert(0, ROOT)
+    import app as assessment
+    from werkzeug.serving import make_server
+
+    app = assessment.create_app(json.loads(args.app_config))
+    with app.app_context():
+        assessment.migrate_db()
+        have = assessment.Question.query.count()
+        if have < args.questions:
+            assessment.import_question_rows(assessment.generate_question_rows(args.questions, args.seed))
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)   # no per-request access log
+    if args.workers == 1:
+        server = make_server('127.0.0.1', args.port, app, threaded=True)
+        print(f"PORT {server.server_port}", flush=True)
+        server.serve_forever()
+        return
+
+    # pre-fork like gunicorn --preload: the workers accept() on one shared listening socket
+    app.config['MULTI_PROCESS'] = True
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', args.port))
+    sock.listen(1024)
+    children = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            make_server('127.0.0.1', 0, app, threaded=True, fd=sock.fileno()).serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, stop)
+    print(f"PORT {sock.getsockname()[1]}", flush=True)
+    for _ in children:
+        os.wait()
+
+
+def start_server(args):
+    cmd = [sys.executable, os.path.abspath(__file__), '--serve', '--db', args.db, '--port', '0',
+           '--questions', str(args.questions), '--seed', str(args.seed), '--app-config', args.app_config,
+           '--workers', str(args.workers)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    for line in proc.stdout:
+        if line.startswith('PORT '):
+            return proc, int(line.split()[1])
+    raise RuntimeError(f"server exited with status {proc.wait()}")
+
+
+# ---------------- Clients ----------------
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}   # endpoint -> [seconds]
+        self.errors = {}
+
+    def call(self, port, method, path, body=None):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        payload = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        key = path.split('?')[0]
+        if key.startswith('/session/'):
+            key = '/session/<id>/stats'
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, payload, headers)
+            resp = conn.getresponse()
+            data = resp.read()
+            ok = resp.status < 400
+        except OSError:
+            data, ok = b'', False
+        finally:
+            conn.close()
+        if ok:
+            self.record(key, time.perf_counter() - started)
+        else:
+            with self.lock:
+                self.errors[key] = self.errors.get(key, 0) + 1
+        return json.loads(data) if ok and data else None
+
+    def record(self, key, elapsed):
+        with self.lock:
+            self.samples.setdefault(key, []).append(elapsed)
+
+
+def load_answers(db_path):
+    conn = sqlite3.connect(db_path)
+    answers = {qid: (answer, json.loads(options)) for qid, answer, options in
+               conn.execute("SELECT id, answer, options FROM question")}
+    conn.close()
+    return answers
+
+
+def pick_option(answers, question, p_correct, rng):
+    answer, options = answers[question['id']]
+    if rng.random() < p_correct:
+        return answer
+    wrong = [o for o in options if o.lower() != answer.lower()]
+    return rng.choice(wrong) if wrong else answer
+
+
+def student(rec, port, answers, n, args, tokens, gate):
+    rng = random.Random(args.seed * 100003 + n)
+    p_correct = args.accuracy[n % len(args.accuracy)]
+    if gate:
+        gate.wait()   # --burst: everyone presses Start in the same instant
+    pressed = time.perf_counter()
+    if tokens:
+        started = rec.call(port, 'POST', '/start_session', {'token': tokens[n]})
+    else:
+        started = rec.call(port, 'POST', '/start_session', {'student': f'bench-{n}', 'roll_no': str(n)})
+    if not started:
+        return
+    sid, diff = started['session_id'], started['next_difficulty']
+    question = started.get('question')
+    for round_no in range(args.rounds):
+        if question is None:
+            question = rec.call(port, 'POST', '/next_question', {'session_id': sid, 'difficulty': diff})
+            if not question:
+                return
+        if round_no == 0:
+            rec.record('time_to_first_question', time.perf_counter() - pressed)
+        body = {'session_id': sid, 'question_id': question['id'],
+                'selected': pick_option(answers, question, p_correct, rng),
+                'time_taken': round(rng.uniform(2, 30), 2)}
+        if args.fused:
+            r = rec.call(port, 'POST', '/answer_and_next', body)
+            question = r and r['question']
+        else:
+            r = rec.call(port, 'POST', '/submit_answer', body)
+            question = None
+        if not r:
+            return
+        diff = r['next_difficulty']
+        if args.think:
+            time.sleep(rng.uniform(0, 2 * args.think))
+
+
+def teacher(rec, port, done, args):
+    while not done.is_set():
+        rec.call(port, 'GET', '/teacher/analytics')
+        done.wait(args.poll_interval)
+
+
+# ---------------- Report ----------------
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return None
+    k = max(0, min(len(sorted_samples) - 1, int(round(pct / 100.0 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[k]
+
+
+def summarize(samples, errors, elapsed):
+    out = {}
+    for key in sorted(set(samples) | set(errors)):
+        xs = sorted(samples.get(key, []))
+        ms = lambda v: round(v * 1000, 2) if v is not None else None
+        out[key] = {
+            'requests': len(xs),
+            'errors': errors.get(key, 0),
+            'throughput_rps': round(len(xs) / elapsed, 1),
+            'mean_ms': ms(sum(xs) / len(xs)) if xs else None,
+            'p50_ms': ms(percentile(xs, 50)),
+            'p95_ms': ms(percentile(xs, 95)),
+            'p99_ms': ms(percentile(xs, 99)),
+            'max_ms': ms(xs[-1]) if xs else None,
+        }
+    return out
+
+
+def compare(report, baseline_path):
+    with open(baseline_path) as f:
+        base = json.load(f)
+    if base.get('config') != report['config']:
+        print("warning: baseline was run with a different config", file=sys.stderr)
+    for key, cur in report['endpoints'].items():
+        old = base.get('endpoints', {}).get(key)
+        if not old:
+            continue
+        cells = []
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            a, b = old.get(metric), cur.get(metric)
+            if a and b is not None:
+                cells.append(f"{metric} {a} -> {b} ({(b - a) / a * 100:+.1f}%)")
+        print(f"{key:24} " + "  ".join(cells), file=sys.stderr)
+
+
+def run(args):
+    own_db = not args.db
+    if own_db:
+        fd, args.db = tempfile.mkstemp(suffix='.db', prefix='assessment-bench-')
+        os.close(fd)
+        os.remove(args.db)
+    proc, port = start_server(args)
+    try:
+        answers = load_answers(args.db)
+        rec = Recorder()
+        tokens = None
+        if args.bulk:   # the teacher provisions the roster ahead of the exam; not part of the timed run
+            roster = [{'student': f'bench-{n}', 'roll_no': str(n)} for n in range(args.students)]
+            tokens = []
+            for i in range(0, len(roster), BULK_CHUNK):   # stay under the server's BULK_ROSTER_MAX
+                created = Recorder().call(port, 'POST', '/sessions/bulk', {'roster': roster[i:i + BULK_CHUNK]})
+                if created is None:
+                    raise RuntimeError(f"/sessions/bulk rejected roster entries {i}..{i + BULK_CHUNK - 1}")
+                tokens += [s['token'] for s in created]
+        gate = threading.Barrier(args.students) if args.burst else None
+        done = threading.Event()
+        teachers = [threading.Thread(target=teacher, args=(rec, port, done, args)) for _ in range(args.teachers)]
+        students = [threading.Thread(target=student, args=(rec, port, answers, n, args, tokens, gate))
+                    for n in range(args.students)]
+        started = time.perf_counter()
+        for t in teachers + students:
+            t.start()
+        for t in students:
+            t.join()
+        done.set()
+        for t in teachers:
+            t.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        proc.terminate()
+        proc.wait()
+        if own_db:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(args.db + suffix):
+                    os.remove(args.db + suffix)
+
+    total = sum(len(v) for v in rec.samples.values())
+    report = {
+        'config': {k: getattr(args, k) for k in ('questions', 'students', 'rounds', 'teachers', 'poll_interval',
+                                                  'accuracy', 'think', 'fused', 'seed', 'app_config',
+                                                  'workers', 'bulk', 'burst')},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'elapsed_s': round(elapsed, 3),
+        'total_requests': total,
+        'throughput_rps': round(total / elapsed, 1),
+        'endpoints': summarize(rec.samples, rec.errors, elapsed),
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        compare(report, args.compare)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--questions', type=int, default=10000, help="question bank size (synthetic)")
+    p.add_argument('--students', type=int, default=100, help="concurrent simulated students")
+    p.add_argument('--rounds', type=int, default=20, help="questions answered per student")
+    p.add_argument('--teachers', type=int, default=2, help="concurrent /teacher/analytics pollers")
+    p.add_argument('--poll-interval', type=float, default=1.0, help="seconds between teacher polls")
+    p.add_argument('--accuracy', type=lambda s: [float(x) for x in s.split(',')], default=[0.9, 0.65, 0.35],
+                   help="comma-separated P(correct) profiles, assigned to students round-robin")
+    p.add_argument('--think', type=float, default=0.0, help="mean think time per question, seconds")
+    p.add_argument('--fused', action='store_true', help="use /answer_and_next instead of submit + next")
+    p.add_argument('--burst', action='store_true', help="release all students at once (exam-start thundering herd)")
+    p.add_argument('--bulk', action='store_true', help="pre-create sessions with /sessions/bulk and start them by token")
+    p.add_argument('--workers', type=int, default=1, help="server processes (pre-forked, MULTI_PROCESS mode)")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--app-config', default='{}', help="JSON merged into app.config, e.g. '{\"WRITE_BEHIND\": true}'")
+    p.add_argument('--db', help="database file to use (default: a temporary file, removed afterwards)")
+    p.add_argument('--out', help="write the JSON report here instead of stdout")
+    p.add_argument('--compare', help="baseline report to diff against (printed to stderr)")
+    p.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    p.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+    if args.serve:
+        serve(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+# gunicorn.conf.py  -- gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 8))   # each open /teacher/stream holds one
+preload_app = True   # import and migrate once; app.py resets per-process state after fork
@@ -0,0 +1,41 @@
+# tests/conftest.py  -- Fresh, isolated apps on temporary databases
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import app as assessment
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """create_app() factory on databases under tmp_path, seeded with the 70 starter questions by default."""
+    made = []
+
+    def make(config=None, name='data.db', seed=True):
+        app = assessment.create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / name}",
+                                     'ARCHIVE_DIR': str(tmp_path / 'archive'), **(config or {})})
+        if seed:
+            with app.app_context():
+                assessment.migrate_db()
+                assessment.seed_questions()
+        made.append(app)
+        return app
+
+    yield make
+    for app in made:
+        app.extensions['assessment']['response_writer'].close()
+        with app.app_context():
+            assessment.db.engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
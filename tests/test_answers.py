@@ -0,0 +1,41 @@
+# tests/test_answers.py  -- /submit_answer and /answer_and_next
+import pytest
+
+
+def start(client):
+    return client.post('/start_session', json={'student': 'S', 'roll_no': '1'}).json['session_id']
+
+
+@pytest.mark.parametrize('path', ['/submit_answer', '/answer_and_next'])
+def test_unknown_question_is_rejected(client, path):
+    sid = start(client)
+    resp = client.post(path, json={'session_id': sid, 'question_id': 9999, 'selected': 'a', 'time_taken': 1.0})
+    assert resp.status_code == 400
+    assert client.get(f'/session/{sid}/stats').json['attempts'] == 0
+
+
+def test_answer_and_next_matches_submit_answer(client):
+    sid = start(client)
+    question = client.post('/next_question', json={'session_id': sid, 'difficulty': 2}).json
+    fused = client.post('/answer_and_next', json={'session_id': sid, 'question_id': question['id'],
+                                                  'selected': 'wrong', 'time_taken': 3.0}).json
+    assert fused['correct'] is False and fused['stats']['attempts'] == 1
+    assert fused['question']['id'] != question['id']
+    assert client.get(f'/session/{sid}/stats').json['attempts'] == 1
+
+
+@pytest.mark.parametrize('path', ['/submit_answer', '/answer_and_next'])
+@pytest.mark.parametrize('change', [{'time_taken': None}, {'time_taken': [1]}, {'time_taken': 'nan'},
+                                    {'time_taken': -1}, {'session_id': None}, {'question_id': 'x'}])
+def test_malformed_answer_is_rejected(client, path, change):
+    sid = start(client)
+    body = {'session_id': sid, 'question_id': 1, 'selected': 'a', 'time_taken': 1.0, **change}
+    assert client.post(path, json=body).status_code == 400
+
+
+@pytest.mark.parametrize('missing', ['session_id', 'question_id'])
+def test_missing_ids_are_rejected(client, missing):
+    body = {'session_id': start(client), 'question_id': 1, 'selected': 'a'}
+    del body[missing]
+    assert client.post('/submit_answer', json=body).status_code == 400
+    assert client.post('/submit_answer', json=[body]).status_code == 400
@@ -0,0 +1,47 @@
+# tests/test_app_factory.py  -- Apps created in one process keep separate caches
+import app as assessment
+
+
+def answer(client, session_id, question_id=1):
+    return client.post('/submit_answer', json={'session_id': session_id, 'question_id': question_id,
+                                               'selected': 'x', 'time_taken': 2.0})
+
+
+def test_two_apps_do_not_share_session_state(make_app):
+    first, second = make_app(name='first.db'), make_app(name='second.db')
+    a, b = first.test_client(), second.test_client()
+    assert a.post('/start_session', json={'student': 'A'}).json['session_id'] == 1
+    for qid in (1, 2, 3):
+        answer(a, 1, qid)
+    # same session id on the other database: its state must start empty
+    assert b.post('/start_session', json={'student': 'B'}).json['session_id'] == 1
+    assert answer(b, 1).json['stats']['attempts'] == 1
+    assert b.get('/session/1/stats').json['attempts'] == 1
+    assert first.extensions['assessment']['question_bank'] is not second.extensions['assessment']['question_bank']
+
+
+def test_proxies_resolve_to_the_current_app(make_app):
+    first, second = make_app(name='first.db'), make_app(name='second.db', seed=False)
+    with first.app_context():
+        assessment.question_bank.ensure_loaded()
+        assert assessment.question_bank.difficulty(1) is not None
+    with second.app_context():
+        assessment.migrate_db()
+        assessment.question_bank.ensure_loaded()
+        assert assessment.question_bank.difficulty(1) is None
+
+
+def test_in_memory_database(make_app):
+    app = make_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'}, seed=False)
+    with app.app_context():
+        assert 'pool_size' not in app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        assessment.migrate_db()
+        assessment.seed_questions()
+    client = app.test_client()
+    sid = client.post('/start_session', json={'student': 'M'}).json['session_id']
+    assert client.post('/next_question', json={'session_id': sid, 'difficulty': 2}).status_code == 200
+
+
+def test_file_database_gets_the_pool_options(app):
+    with app.app_context():
+        assert assessment.db.engine.pool.size() == assessment.DefaultConfig.SQLALCHEMY_POOL_OPTIONS['pool_size']
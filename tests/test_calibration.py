@@ -0,0 +1,59 @@
+# tests/test_calibration.py  -- flask calibrate against a live database
+import random
+import sqlite3
+
+import pytest
+
+import app as assessment
+
+
+def answer_many(client, n, seed):
+    rng = random.Random(seed)
+    for _ in range(n):
+        sid = client.post('/start_session', json={}).json['session_id']
+        for qid in rng.sample(range(1, 71), 8):
+            client.post('/submit_answer', json={'session_id': sid, 'question_id': qid,
+                                                'selected': rng.choice(['x', 'y']), 'time_taken': rng.random() * 9})
+
+
+def calibration(app):
+    with app.app_context():
+        return assessment.db.session.execute(assessment.text(
+            "SELECT question_id, responses, correct, round(total_time, 6), round(total_ability, 6) "
+            "FROM item_calibration ORDER BY question_id")).all()
+
+
+def test_incremental_runs_add_up_to_a_full_run(app):
+    client = app.test_client()
+    answer_many(client, 10, seed=1)
+    with app.app_context():
+        assessment.calibrate_items(chunk_size=7, min_responses=1)
+    answer_many(client, 10, seed=2)
+    with app.app_context():
+        read, _ = assessment.calibrate_items(chunk_size=7, min_responses=1)
+    assert read == 80
+    incremental = calibration(app)
+    with app.app_context():
+        assert assessment.calibrate_items(chunk_size=7, full=True, min_responses=1)[0] == 160
+    assert [row[:3] for row in calibration(app)] == [row[:3] for row in incremental]
+
+
+@pytest.mark.parametrize('full', [False, True])
+def test_scan_does_not_block_writers(app, tmp_path, monkeypatch, full):
+    answer_many(app.test_client(), 5, seed=3)
+    real_abilities = assessment.session_abilities
+    committed = []
+
+    def abilities_then_write(conn):
+        # a live answer arriving mid-scan must commit at once, not wait for the job
+        other = sqlite3.connect(tmp_path / 'data.db', timeout=0)
+        other.execute("INSERT INTO job_state (name, value) VALUES ('probe', 1)")
+        other.commit()
+        other.close()
+        committed.append(True)
+        return real_abilities(conn)
+
+    monkeypatch.setattr(assessment, 'session_abilities', abilities_then_write)
+    with app.app_context():
+        assert assessment.calibrate_items(chunk_size=10, full=full, min_responses=1)[0] == 40
+    assert committed and len(calibration(app)) > 0
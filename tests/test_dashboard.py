@@ -0,0 +1,55 @@
+# tests/test_dashboard.py  -- /teacher/stream row deltas
+import json
+import queue
+
+import pytest
+
+import app as assessment
+
+LIVE = {'SSE_INTERVAL': 0.05}
+
+
+def next_rows(q, timeout=5):
+    event = q.get(timeout=timeout)
+    assert event.startswith(b"event: rows\ndata: ")
+    return json.loads(event.split(b"data: ", 1)[1])
+
+
+@pytest.fixture
+def subscribe():
+    subscribed = []
+
+    def sub(app):
+        with app.app_context():
+            q = assessment.analytics_hub.subscribe()
+        subscribed.append((app, q))
+        return q
+
+    yield sub
+    for app, q in subscribed:
+        with app.app_context():
+            assessment.analytics_hub.unsubscribe(q)
+
+
+def test_local_answers_are_pushed(make_app, subscribe):
+    app = make_app(LIVE)
+    q = subscribe(app)
+    client = app.test_client()
+    sid = client.post('/start_session', json={'student': 'Live'}).json['session_id']
+    assert [r['session_id'] for r in next_rows(q)] == [sid]
+    client.post('/submit_answer', json={'session_id': sid, 'question_id': 1, 'selected': 'x', 'time_taken': 1})
+    assert next_rows(q)[0]['attempts'] == 1
+
+
+def test_other_workers_answers_reach_the_stream(make_app, subscribe):
+    # two apps on one database stand in for two gunicorn workers
+    streaming = make_app({**LIVE, 'MULTI_PROCESS': True})
+    other = make_app({**LIVE, 'MULTI_PROCESS': True}, seed=False)
+    q = subscribe(streaming)
+    with pytest.raises(queue.Empty):
+        q.get(timeout=0.3)   # nothing changed yet: polling alone sends nothing
+    client = other.test_client()
+    sid = client.post('/start_session', json={'student': 'Elsewhere'}).json['session_id']
+    assert [r['student'] for r in next_rows(q)] == ['Elsewhere']
+    client.post('/submit_answer', json={'session_id': sid, 'question_id': 1, 'selected': 'x', 'time_taken': 1})
+    assert next_rows(q) == [client.get(f'/session/{sid}/stats').json]
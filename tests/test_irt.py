@@ -0,0 +1,58 @@
+# tests/test_irt.py  -- IRT engine item selection and payload caching
+import pytest
+
+import app as assessment
+
+IRT = {'ADAPTIVE_ENGINE': 'irt'}
+
+
+@pytest.fixture
+def irt_app(make_app):
+    return make_app(IRT)
+
+
+def test_pick_masks_used_items(irt_app):
+    with irt_app.app_context():
+        engine = assessment.adaptive_engine()
+        ids = assessment.question_bank.item_arrays()[0].tolist()
+        state = assessment.SessionState()
+        state.used = set(ids[:-1])
+        assert {engine.pick(state, 3) for _ in range(20)} == {ids[-1]}
+        state.used = set(ids)
+        assert engine.pick(state, 3) in ids   # whole bank used: heuristic fallback
+
+
+def test_session_never_repeats_until_the_bank_is_used_up(irt_app):
+    client = irt_app.test_client()
+    sid = client.post('/start_session', json={}).json['session_id']
+    question = client.post('/next_question', json={'session_id': sid, 'difficulty': 2}).json
+    seen = []
+    for _ in range(69):
+        seen.append(question['id'])
+        reply = client.post('/answer_and_next', json={'session_id': sid, 'question_id': question['id'],
+                                                      'selected': 'x', 'time_taken': 1.0}).json
+        assert 'theta' in reply['stats']
+        question = reply['question']
+    seen.append(question['id'])
+    assert len(set(seen)) == 70
+
+
+def test_payloads_are_cached_without_the_bucket_index(irt_app, monkeypatch):
+    client = irt_app.test_client()
+    sid = client.post('/start_session', json={}).json['session_id']
+    question = client.post('/next_question', json={'session_id': sid, 'difficulty': 2}).json
+    with irt_app.app_context():
+        bank = assessment.question_bank
+        assert not bank._loaded and question['id'] in bank._payloads
+        cached = bank.payload(question['id'])
+        monkeypatch.setattr(assessment.db.session, 'get', lambda *a: pytest.fail("payload read the database"))
+        assert bank.payload(question['id']) is cached
+
+
+def test_edit_drops_a_cached_payload(irt_app):
+    with irt_app.app_context():
+        bank = assessment.question_bank
+        bank.payload(1)
+        assessment.db.session.get(assessment.Question, 1).text = 'Edited'
+        assessment.db.session.commit()
+        assert b'Edited' in bank.payload(1)
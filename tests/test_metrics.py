@@ -0,0 +1,58 @@
+# tests/test_metrics.py  -- /metrics and sampled profiling
+import cProfile
+import threading
+
+import app as assessment
+
+METRICS = {'METRICS_ENABLED': True, 'PROFILE_SAMPLE_RATE': 1.0, 'PROFILE_SLOW_SECONDS': 0.0}
+
+
+class SingleProfiler(cProfile.Profile):
+    """cProfile.Profile as Python 3.12+ behaves: only one may be enabled at a time."""
+    active = 0
+    lock = threading.Lock()
+
+    def enable(self):
+        with self.lock:
+            if SingleProfiler.active:
+                raise ValueError("Another profiling tool is already active")
+            SingleProfiler.active += 1
+        self.on = True
+        super().enable()
+
+    def disable(self):   # pstats calls it again through create_stats()
+        super().disable()
+        with self.lock:
+            if getattr(self, 'on', False):
+                self.on = False
+                SingleProfiler.active -= 1
+
+
+def test_metrics_endpoint(make_app):
+    client = make_app({'METRICS_ENABLED': True}).test_client()
+    client.post('/start_session', json={})
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'assessment_requests_total{route="/start_session",method="POST",status="200"} 1' in body
+    assert 'assessment_request_sql_queries_count{route="/start_session"} 1' in body
+
+
+def test_concurrent_sampled_requests_share_one_profiler(make_app, monkeypatch):
+    monkeypatch.setattr(assessment.cProfile, 'Profile', SingleProfiler)
+    app = make_app(METRICS)
+    gate = threading.Barrier(8)
+    statuses = []
+
+    def run():
+        client = app.test_client()
+        gate.wait()
+        for _ in range(5):
+            statuses.append(client.get('/_ping').status_code)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert statuses == [200] * 40
+    assert SingleProfiler.active == 0
+    assert not assessment._profile_lock.locked()
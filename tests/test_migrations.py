@@ -0,0 +1,54 @@
+# tests/test_migrations.py  -- Upgrading a data.db written by the original single-file app
+import sqlite3
+
+import app as assessment
+
+# what the original app's db.create_all() produced (PRAGMA user_version 0, options as str(list))
+BASELINE_SCHEMA = """
+CREATE TABLE question (
+    id INTEGER NOT NULL, text VARCHAR NOT NULL, options VARCHAR NOT NULL, answer VARCHAR NOT NULL,
+    difficulty INTEGER NOT NULL, subject VARCHAR NOT NULL, PRIMARY KEY (id));
+CREATE TABLE session (
+    id INTEGER NOT NULL, student VARCHAR NOT NULL, roll_no VARCHAR,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (id));
+CREATE TABLE response (
+    id INTEGER NOT NULL, session_id INTEGER, question_id INTEGER, correct BOOLEAN, difficulty INTEGER,
+    time_taken FLOAT, subject VARCHAR, PRIMARY KEY (id), FOREIGN KEY(session_id) REFERENCES session (id));
+INSERT INTO question VALUES (1, 'What is 2 + 3?', "['4', '5', '6', '7']", '5', 1, 'Maths');
+INSERT INTO question VALUES (2, 'Unit of force?', "['Joule', 'Newton', 'Watt', 'Pascal']", 'Newton', 2, 'Physics');
+INSERT INTO session (id, student, roll_no) VALUES (1, 'Asha', '17');
+INSERT INTO response VALUES (1, 1, 1, 1, 1, 4.5, 'Maths');
+INSERT INTO response VALUES (2, 1, 2, 0, 2, 9.0, 'Physics');
+"""
+
+
+def test_baseline_database_upgrades(tmp_path):
+    path = tmp_path / 'data.db'
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+    app = assessment.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    client = app.test_client()
+
+    # the first request runs every migration step
+    analytics = client.get('/teacher/analytics')
+    assert analytics.status_code == 200
+    assert [(row['student'], row['attempts']) for row in analytics.json] == [('Asha', 2)]
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == assessment.SCHEMA_VERSION
+    indexes = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'ix_question_external_id', 'ix_question_bank', 'ix_response_session', 'ix_session_student',
+            'ix_session_roll_no', 'ix_session_created_at', 'ix_session_token'} <= indexes
+    assert conn.execute("SELECT options FROM question WHERE id = 1").fetchone()[0] == '["4", "5", "6", "7"]'
+    conn.close()
+
+    # old and bulk-provisioned sessions both work on the upgraded schema
+    started = client.post('/start_session', json={'student': 'Ravi', 'roll_no': '18'})
+    assert started.status_code == 200
+    bulk = client.post('/sessions/bulk', json={'roster': [{'student': 'Meera', 'roll_no': '19'}]})
+    assert bulk.status_code == 200
+    by_token = client.post('/start_session', json={'token': bulk.json[0]['token']})
+    assert by_token.status_code == 200
+    answer = client.post('/submit_answer', json={'session_id': 1, 'question_id': 2, 'selected': 'Newton',
+                                                 'time_taken': 3.0})
+    assert answer.status_code == 200 and answer.json['correct'] is True
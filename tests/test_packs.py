@@ -0,0 +1,62 @@
+# tests/test_packs.py  -- Offline test packs: the precomputed tree against the /submit_batch replay
+import random
+
+import pytest
+
+import app as assessment
+
+
+def walk(app, pack, rng):
+    """Answer down one path of the pack like the frontend does; returns (answers, nodes visited)."""
+    with app.app_context():
+        keys = dict(assessment.db.session.query(assessment.Question.id, assessment.Question.answer))
+    answers, node, path = [], 0, []
+    for level in range(pack['depth']):
+        slot = level * 5 + int(pack['nodes'][node]) - 1
+        question = pack['questions'][slot]
+        right = rng.random() < 0.5
+        selected = keys[question['id']] if right else 'not an option'
+        assert (assessment.pack_key(pack['salt'], selected) == pack['keys'][slot]) is right
+        answers.append({'question_id': question['id'], 'selected': selected, 'time_taken': 2.0})
+        node = 2 * node + (2 if right else 1)
+        path.append(node)
+    return answers, path
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_tree_matches_the_batch_replay(app, seed):
+    client = app.test_client()
+    sid = client.post('/start_session', json={}).json['session_id']
+    pack = client.post('/test_pack', json={'session_id': sid, 'difficulty': 3}).json
+    answers, path = walk(app, pack, random.Random(seed))
+    assert len({a['question_id'] for a in answers}) == len(answers)
+    reply = client.post('/submit_batch', json={'session_id': sid, 'difficulty': 3, 'answers': answers}).json
+    # the difficulty the server picks after each answer is the one the tree branched to offline
+    assert [r['next_difficulty'] for r in reply['results'][:-1]] == [int(pack['nodes'][n]) for n in path[:-1]]
+    assert reply['stats']['attempts'] == pack['depth']
+
+
+def test_retried_batch_is_recorded_once(app):
+    client = app.test_client()
+    sid = client.post('/start_session', json={}).json['session_id']
+    pack = client.post('/test_pack', json={'session_id': sid}).json
+    body = {'session_id': sid, 'batch_id': pack['salt'], 'answers': walk(app, pack, random.Random(7))[0]}
+    first = client.post('/submit_batch', json=body).json
+    again = client.post('/submit_batch', json=body).json
+    assert again == first
+    with app.app_context():
+        assert assessment.db.session.execute(assessment.text("SELECT count(*) FROM response")).scalar() == pack['depth']
+        assessment.session_states.discard(sid)
+    assert client.get(f'/session/{sid}/stats').json['attempts'] == pack['depth']
+    # the same batch id in another session is a different batch
+    other = client.post('/start_session', json={}).json['session_id']
+    assert client.post('/submit_batch', json={**body, 'session_id': other}).json['stats']['attempts'] == pack['depth']
+
+
+def test_batch_longer_than_a_pack_path_is_refused_before_parsing(app):
+    client = app.test_client()
+    sid = client.post('/start_session', json={}).json['session_id']
+    too_many = [None] * (app.config['TEST_PACK_MAX_DEPTH'] + 1)
+    reply = client.post('/submit_batch', json={'session_id': sid, 'answers': too_many})
+    assert reply.status_code == 400 and reply.json['error'] == 'too many answers'
+    assert client.post('/submit_batch', json={'session_id': sid, 'batch_id': 5, 'answers': []}).status_code == 400
@@ -0,0 +1,49 @@
+# tests/test_provisioning.py  -- /sessions/bulk start tokens and their inline first question
+import app as assessment
+
+
+def provision(app, n=3):
+    """Bulk-create n sessions; each entry gains the first_question_id stored for it."""
+    roster = [{'student': f'S{i}', 'roll_no': str(i)} for i in range(n)]
+    entries = app.test_client().post('/sessions/bulk', json={'roster': roster}).json
+    with app.app_context():
+        for e in entries:
+            e['first_question_id'] = assessment.db.session.get(assessment.Session, e['session_id']).first_question_id
+    return entries
+
+
+def test_first_question_survives_a_cold_bank(app):
+    client = app.test_client()
+    entry = provision(app)[0]
+    # a restarted worker, or one that never loaded the bank, starts from an empty index
+    app.extensions['assessment']['question_bank'].invalidate()
+    started = client.post('/start_session', json={'token': entry['token']}).json
+    assert started['session_id'] == entry['session_id']
+    assert started['question']['id'] == entry['first_question_id']
+
+
+def test_first_question_from_another_worker(make_app, app):
+    entry = provision(app)[0]
+    other = make_app(name='data.db', seed=False)   # second app on the same database
+    started = other.test_client().post('/start_session', json={'token': entry['token']}).json
+    assert started['question']['id'] == entry['first_question_id']
+
+
+def test_no_inline_question_once_answered(app):
+    client = app.test_client()
+    entry = provision(app)[0]
+    client.post('/submit_answer', json={'session_id': entry['session_id'], 'question_id': entry['first_question_id'],
+                                        'selected': 'x', 'time_taken': 1})
+    assert 'question' not in client.post('/start_session', json={'token': entry['token']}).json
+
+
+def test_removed_first_question_and_unknown_token(app):
+    client = app.test_client()
+    entry = provision(app)[0]
+    with app.app_context():
+        assessment.db.session.execute(assessment.text("DELETE FROM question WHERE id = :id"),
+                                      {'id': entry['first_question_id']})
+        assessment.db.session.commit()
+        assessment.question_bank.remove(entry['first_question_id'])
+    assert 'question' not in client.post('/start_session', json={'token': entry['token']}).json
+    assert client.post('/start_session', json={'token': 'nope'}).status_code == 404
@@ -0,0 +1,96 @@
+# tests/test_write_behind.py  -- ResponseWriter batching, failure isolation and bounded waits
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import app as assessment
+
+WRITE_BEHIND = {'WRITE_BEHIND': True, 'WRITE_BEHIND_DURABILITY': 'group', 'WRITE_BEHIND_INTERVAL': 0.05}
+
+
+def row(session_id, question_id, time_taken=1.0):
+    return dict(session_id=session_id, question_id=question_id, correct=True, difficulty=1,
+                time_taken=time_taken, subject='Maths')
+
+
+def submit_together(app, rows):
+    """submit() every row from its own thread so they share a batch; returns the rows that raised."""
+    failed = []
+
+    def run(r):
+        with app.app_context():
+            try:
+                assessment.response_writer.submit(r)
+            except RuntimeError:
+                failed.append(r['question_id'])
+
+    threads = [threading.Thread(target=run, args=(r,)) for r in rows]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(20)
+    assert not any(t.is_alive() for t in threads)
+    return failed
+
+
+def stored(app):
+    with app.app_context():
+        assessment.response_writer.flush()
+        ids = assessment.db.session.execute(assessment.text("SELECT question_id FROM response ORDER BY id")).scalars().all()
+        stats = assessment.db.session.execute(assessment.text("SELECT attempts, total_time FROM session_stats")).all()
+    return sorted(ids), stats
+
+
+def test_bad_row_is_isolated_and_dropped(make_app):
+    app = make_app(WRITE_BEHIND)
+    sid = app.test_client().post('/start_session', json={}).json['session_id']
+    failed = submit_together(app, [row(sid, 1), row(sid, 2), row(sid, 3, time_taken=None), row(sid, 4), row(sid, 5)])
+    assert failed == [3]
+    ids, stats = stored(app)
+    assert ids == [1, 2, 4, 5]
+    assert [tuple(s) for s in stats] == [(4, 4.0)]
+
+
+def test_missing_table_fails_the_request_instead_of_hanging(make_app):
+    app = make_app(WRITE_BEHIND)
+    client = app.test_client()
+    sid = client.post('/start_session', json={}).json['session_id']
+    with app.app_context(), assessment.db.engine.begin() as conn:
+        conn.exec_driver_sql("DROP TABLE session_subject_stats")
+    started = time.monotonic()
+    resp = client.post('/submit_answer', json={'session_id': sid, 'question_id': 1, 'selected': 'a', 'time_taken': 1})
+    assert resp.status_code == 500
+    assert time.monotonic() - started < 5
+
+
+def test_lock_timeouts_are_retried_then_dropped(make_app, tmp_path):
+    app = make_app({**WRITE_BEHIND, 'WRITE_BEHIND_RETRIES': 1,
+                    'SQLITE_PRAGMAS': {**assessment.DefaultConfig.SQLITE_PRAGMAS, 'busy_timeout': 50}})
+    sid = app.test_client().post('/start_session', json={}).json['session_id']
+    blocker = sqlite3.connect(tmp_path / 'data.db', isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        assert submit_together(app, [row(sid, 1), row(sid, 2)]) == [1, 2]
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    assert submit_together(app, [row(sid, 3)]) == []
+    assert stored(app)[0] == [3]
+
+
+def test_waits_are_bounded_when_the_writer_is_stuck(make_app, monkeypatch):
+    app = make_app({**WRITE_BEHIND, 'WRITE_BEHIND_TIMEOUT': 0.3})
+    release = threading.Event()
+    real_write = assessment.ResponseWriter._write
+    monkeypatch.setattr(assessment.ResponseWriter, '_write',
+                        lambda self, engine, rows: release.wait(10) and real_write(self, engine, rows))
+    sid = app.test_client().post('/start_session', json={}).json['session_id']
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            assessment.response_writer.submit(row(sid, 1))
+        with pytest.raises(RuntimeError):
+            assessment.response_writer.flush()
+    release.set()
+    assert stored(app)[0] == [1]   # the row itself still went in once the writer recovered
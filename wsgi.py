@@ -0,0 +1,12 @@
+# wsgi.py  -- Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+Settings come from ASSESSMENT_* environment variables (values parsed as JSON),
+e.g. ASSESSMENT_WRITE_BEHIND=true ASSESSMENT_ADAPTIVE_ENGINE=irt, and are applied
+before the database is set up, so ASSESSMENT_SQLALCHEMY_DATABASE_URI works too.
+"""
+from app import create_app, migrate_db
+
+app = create_app({'MULTI_PROCESS': True}, env_prefix='ASSESSMENT')
+
+with app.app_context():
+    migrate_db()   # once, in the gunicorn master, before the workers fork